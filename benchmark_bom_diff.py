@@ -0,0 +1,66 @@
+"""对比两个版本 BOM 的耗时，不经过页面直接调用 bom_diff.compare_boms
+
+用法：python benchmark_bom_diff.py --lines 1000 10000 30000 --other-columns 20
+指定 --levels 时生成多层 BOM，同时对比单层对比和按层级的 compare_bom_trees：
+python benchmark_bom_diff.py --lines 100000 --levels 8 --change-rate 0.001
+"""
+import numpy as np
+import pandas as pd
+
+from benchmark_utils import benchmark_parser, best_of
+from bom_diff import compare_bom_trees, compare_boms
+
+
+def generate_bom(lines, other_columns, seed, levels=None, change_rate=0.05):
+    """生成 BOM：物料编码、逗号分隔的位置号和若干属性列，不同 seed 之间约 change_rate 的行有变化
+
+    指定 levels 时增加层级列，每行的层级不超过上一行加一，最深为 levels 层。
+    """
+    rng = np.random.default_rng(0)
+    changed = np.random.default_rng(seed).random(lines) < change_rate
+    counts = rng.integers(1, 8, lines)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    bom = pd.DataFrame({
+        '物料编码': [f'M{i:06d}' for i in range(lines)],
+        '位置号': [','.join(f'R{k}' for k in range(start + int(change), start + count + int(change)))
+                  for start, count, change in zip(starts, counts, changed)],
+    })
+    for i in range(other_columns):
+        values = rng.integers(0, 100, lines)
+        bom[f'属性{i}'] = np.where(changed, values + 1, values)
+    if levels:
+        steps = rng.integers(-1, 2, lines)
+        level = np.empty(lines, dtype=np.int64)
+        current = 0
+        for i, step in enumerate(steps):
+            current = min(max(current + int(step), 1), levels, current + 1)
+            level[i] = current
+        bom.insert(0, '层级', level)
+    return bom
+
+
+def main():
+    parser = benchmark_parser('对比两个版本 BOM 的耗时')
+    parser.add_argument('--lines', type=int, nargs='+', default=[1000, 10000, 30000])
+    parser.add_argument('--other-columns', type=int, default=20)
+    parser.add_argument('--levels', type=int, default=None, help='生成的多层 BOM 的最大层数')
+    parser.add_argument('--change-rate', type=float, default=0.05, help='两个版本间有变化的行的比例')
+    args = parser.parse_args()
+
+    for lines in args.lines:
+        original_bom = generate_bom(lines, args.other_columns, 1, args.levels, args.change_rate)
+        new_bom = generate_bom(lines, args.other_columns, 2, args.levels, args.change_rate)
+        other_columns = [f'属性{i}' for i in range(args.other_columns)]
+        compares = {'单层对比': lambda: compare_boms(original_bom, new_bom, '物料编码', '位置号', other_columns)}
+        if args.levels:
+            compares['按层级对比'] = lambda: compare_bom_trees(original_bom, new_bom, '物料编码', '层级', '位置号',
+                                                         other_columns)
+        for label, compare in compares.items():
+            best, result = best_of(compare, args.repeat)
+            counts = ', '.join(f'{name} {table if isinstance(table, int) else len(table)}'
+                               for name, table in result.items())
+            print(f"{label} {lines} 行 x {args.other_columns} 个属性列 {best:8.2f} 秒（{counts}）")
+
+
+if __name__ == '__main__':
+    main()
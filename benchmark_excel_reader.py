@@ -0,0 +1,49 @@
+"""对比各 Excel 解析后端的读取耗时
+
+用法：python benchmark_excel_reader.py --rows 10000 100000 1000000
+"""
+import io
+from datetime import datetime, timedelta
+
+import xlsxwriter
+
+from benchmark_utils import benchmark_parser, best_of
+from excel_loader import available_backends, read_excel
+
+
+def generate_workbook(rows):
+    """生成包含整数、小数、文本、日期列的测试工作簿"""
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    sheet = workbook.add_worksheet()
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    sheet.write_row(0, 0, ['编号', '金额', '客户名称', '类别', '日期'])
+    start = datetime(2024, 1, 1)
+    for i in range(rows):
+        sheet.write_number(i + 1, 0, i)
+        sheet.write_number(i + 1, 1, i * 1.25)
+        sheet.write_string(i + 1, 2, f'客户{i % 5000}')
+        sheet.write_string(i + 1, 3, f'类别{i % 20}')
+        sheet.write_datetime(i + 1, 4, start + timedelta(days=i % 365), date_format)
+    workbook.close()
+    return output.getvalue()
+
+
+def main():
+    parser = benchmark_parser('对比各 Excel 解析后端的读取耗时')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    backends = available_backends()
+    print(f"可用后端: {', '.join(backends)}")
+    for rows in args.rows:
+        data = generate_workbook(rows)
+        print(f"\n{rows} 行（{len(data) / 1024 / 1024:.1f} MB）")
+        for backend in backends:
+            best, df = best_of(lambda: read_excel(io.BytesIO(data), backend=backend), args.repeat)
+            assert len(df) == rows
+            print(f"  {backend:<10} {best:8.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
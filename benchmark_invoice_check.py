@@ -0,0 +1,31 @@
+"""检查连号发票的耗时，不经过页面直接调用 invoice_check.check_consecutive_invoices
+
+用法：python benchmark_invoice_check.py --rows 10000 100000 500000
+"""
+import numpy as np
+import pandas as pd
+
+from benchmark_utils import benchmark_parser, best_of
+from invoice_check import check_consecutive_invoices
+
+
+def generate_invoices(rows, seed=0):
+    """生成 20 位的全电发票号，号码从较小的区间中随机抽取，约有一成的发票存在连号"""
+    rng = np.random.default_rng(seed)
+    numbers = rng.integers(0, rows * 20, rows)
+    return pd.DataFrame({'发票号码': [f'24{number:018d}' for number in numbers]})
+
+
+def main():
+    parser = benchmark_parser('检查连号发票的耗时')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        df = generate_invoices(rows)
+        best, result = best_of(lambda: check_consecutive_invoices(df, '发票号码'), args.repeat)
+        print(f"{rows} 张发票 {best:8.2f} 秒（连号 {len(result)} 张）")
+
+
+if __name__ == '__main__':
+    main()
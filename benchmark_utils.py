@@ -0,0 +1,22 @@
+"""各基准测试脚本共用的参数解析和计时"""
+import argparse
+import time
+
+
+def benchmark_parser(description):
+    """创建带有共用的 --repeat 参数的命令行解析器"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--repeat', type=int, default=1, help='每项重复运行的次数，取最短的耗时')
+    return parser
+
+
+def best_of(fn, repeat):
+    """运行 fn repeat 次，返回 (最短耗时秒数, 最后一次的返回值)"""
+    best = None
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
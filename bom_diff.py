@@ -0,0 +1,397 @@
+import numpy as np
+import pandas as pd
+
+from excel_diff import SUFFIXES, diff_columns
+
+# 长表中的位置号列名
+POSITION = '位置号'
+
+# 其他列差异长表的列名，物料编码重复时增加行序号列
+LINE = '行序号'
+COLUMN = '列名'
+OLD_VALUE = '旧版本值'
+NEW_VALUE = '新版本值'
+
+
+def explode_positions(bom, material_column, position_column):
+    """把 BOM 的位置号拆成 (物料编码, 位置号) 长表
+
+    全角逗号统一为半角逗号后按逗号拆分并去除前后空格，空值、非文本和空白位置号忽略，
+    同一物料的重复位置号只保留一个，保持首次出现的顺序。
+    """
+    # 逐行用 Python 的 str.replace 和 str.split 拆分，再一次性展开为长表；
+    # 按 30 万行测试，比 Series.str 的方法加 explode 略快
+    parts = [value.replace('，', ',').split(',') if isinstance(value, str) else []
+             for value in bom[position_column].to_numpy(dtype=object)]
+    long = pd.DataFrame({
+        material_column: np.repeat(bom[material_column].to_numpy(), [len(row) for row in parts]),
+        POSITION: [position.strip() for row in parts for position in row],
+    })
+    long = long[long[POSITION] != '']
+    return long.drop_duplicates(ignore_index=True)
+
+
+def diff_positions(original_bom, new_bom, material_column, position_column):
+    """对比两个版本中都存在的物料的位置号
+
+    返回 (新版本有而旧版本没有, 旧版本有而新版本没有) 两个 (物料编码, 位置号) 长表。
+    物料和位置号在两个版本间统一编码为整数，集合差只需对整数计数。
+    """
+    old_long = explode_positions(original_bom, material_column, position_column)
+    new_long = explode_positions(new_bom, material_column, position_column)
+    n_old, n_new, n_old_long = len(original_bom), len(new_bom), len(old_long)
+
+    material_codes, materials = pd.factorize(pd.concat(
+        [original_bom[material_column], new_bom[material_column], old_long[material_column],
+         new_long[material_column]], ignore_index=True), use_na_sentinel=False)
+    position_codes, positions = pd.factorize(pd.concat([old_long[POSITION], new_long[POSITION]], ignore_index=True))
+
+    # 只对比两个版本都有的物料
+    in_old = np.bincount(material_codes[:n_old], minlength=len(materials)) > 0
+    in_new = np.bincount(material_codes[n_old:n_old + n_new], minlength=len(materials)) > 0
+    long_materials = material_codes[n_old + n_new:]
+    common = in_old[long_materials] & in_new[long_materials]
+
+    # (物料, 位置号) 组合编码后，另一版本中没有出现的组合即为差异
+    pair_codes, pairs = pd.factorize(long_materials.astype(np.int64) * (len(positions) + 1) + position_codes)
+    old_pairs, new_pairs = pair_codes[:n_old_long], pair_codes[n_old_long:]
+    in_old_pairs = np.bincount(old_pairs, minlength=len(pairs)) > 0
+    in_new_pairs = np.bincount(new_pairs, minlength=len(pairs)) > 0
+    added = new_long[common[n_old_long:] & ~in_old_pairs[new_pairs]].reset_index(drop=True)
+    removed = old_long[common[:n_old_long] & ~in_new_pairs[old_pairs]].reset_index(drop=True)
+    return added, removed
+
+
+def join_positions(long, material_column):
+    """把长表按物料合并为一行，位置号用逗号连接"""
+    return long.groupby(material_column, sort=False)[POSITION].agg(', '.join).reset_index()
+
+
+def _material_codes(original_bom, new_bom, material_column):
+    """把两个版本的物料编码统一编码为整数，返回 (旧版本编码, 新版本编码, 物料编码)，编码即首次出现的顺序"""
+    codes, materials = pd.factorize(pd.concat([original_bom[material_column], new_bom[material_column]],
+                                              ignore_index=True), use_na_sentinel=False)
+    return codes[:len(original_bom)], codes[len(original_bom):], materials
+
+
+def _line_numbers(codes):
+    """各行是所属物料的第几行，从 1 开始"""
+    return pd.Series(codes).groupby(codes).cumcount().to_numpy() + 1
+
+
+def merge_sizes(original_bom, new_bom, material_column):
+    """返回 (按物料编码直接关联的行数, 按物料编码和行序号关联的行数)
+
+    物料编码重复时直接关联的行数按两边行数的乘积增长，前者明显大于后者时说明存在会膨胀的重复物料。
+    """
+    old_codes, new_codes, materials = _material_codes(original_bom, new_bom, material_column)
+    old_counts = np.bincount(old_codes, minlength=len(materials))
+    new_counts = np.bincount(new_codes, minlength=len(materials))
+    return int((old_counts * new_counts).sum()), int(np.minimum(old_counts, new_counts).sum())
+
+
+def diff_materials(original_bom, new_bom, material_column):
+    """返回 (旧版本有而新版本没有, 新版本有而旧版本没有) 的物料编码，按在各自版本中首次出现的顺序"""
+    old_codes, new_codes, materials = _material_codes(original_bom, new_bom, material_column)
+    in_old = np.bincount(old_codes, minlength=len(materials)) > 0
+    in_new = np.bincount(new_codes, minlength=len(materials)) > 0
+    old_codes = pd.unique(old_codes)
+    new_codes = pd.unique(new_codes)
+    removed = pd.Series(materials.take(old_codes[~in_new[old_codes]]), dtype=object)
+    added = pd.Series(materials.take(new_codes[~in_old[new_codes]]), dtype=object)
+    return removed, added
+
+
+def diff_lines(original_bom, new_bom, material_column, columns=()):
+    """返回 (旧版本多出的行, 新版本多出的行)
+
+    两个版本都有的物料按物料编码和行序号逐行对应，一个版本中该物料的行数多于另一个版本时，
+    多出的行没有可对应的行，单独列出。各表包含物料编码、行序号和 columns 中存在的列。
+    只在一个版本中出现的物料由 diff_materials 列出，不在这里重复。
+    """
+    old_codes, new_codes, materials = _material_codes(original_bom, new_bom, material_column)
+    old_counts = np.bincount(old_codes, minlength=len(materials))
+    new_counts = np.bincount(new_codes, minlength=len(materials))
+
+    tables = []
+    for bom, codes, other_counts in ((original_bom, old_codes, new_counts), (new_bom, new_codes, old_counts)):
+        lines = _line_numbers(codes)
+        rows = np.flatnonzero((other_counts[codes] > 0) & (lines > other_counts[codes]))
+        table = pd.DataFrame({material_column: bom[material_column].to_numpy()[rows], LINE: lines[rows]})
+        for col in columns:
+            if col in bom.columns and col != material_column:
+                table[col] = bom[col].to_numpy()[rows]
+        tables.append(table)
+    return tables[0], tables[1]
+
+
+def diff_other_columns(original_bom, new_bom, material_column, columns):
+    """对比相同物料编码的其他列，返回 (物料编码, 列名, 旧版本值, 新版本值) 长表
+
+    同一物料有多行时按物料编码和行序号逐行对应，不会产生笛卡尔积，此时长表中增加行序号列；
+    多出的行没有可对应的行，不参与对比，由 diff_lines 单独列出。只在一个版本中存在的列不参与对比。
+    """
+    columns = [col for col in columns if col in original_bom.columns and col in new_bom.columns and
+               col != material_column]
+    old_codes, new_codes, _ = _material_codes(original_bom, new_bom, material_column)
+    old_lines = _line_numbers(old_codes)
+    new_lines = _line_numbers(new_codes)
+    pairs = pd.merge(pd.DataFrame({'code': old_codes, 'line': old_lines, 'pos1': np.arange(len(old_codes))}),
+                     pd.DataFrame({'code': new_codes, 'line': new_lines, 'pos2': np.arange(len(new_codes))}),
+                     on=['code', 'line'])
+    pos1 = pairs['pos1'].to_numpy()
+    pos2 = pairs['pos2'].to_numpy()
+
+    materials = original_bom[material_column].to_numpy()[pos1]
+    has_duplicates = (old_lines > 1).any() or (new_lines > 1).any()
+    lead = {material_column: materials}
+    if has_duplicates:
+        lead[LINE] = old_lines[pos1]
+    return _long_diffs(original_bom, new_bom, pos1, pos2, columns, lead)
+
+
+def _long_diffs(original_bom, new_bom, pos1, pos2, columns, lead):
+    """对比两个版本中 (pos1, pos2) 逐对对应的行，返回 (lead 各列, 列名, 旧版本值, 新版本值) 长表
+
+    lead 为与行对按位置对齐的前导列，所有列的不一致矩阵一次算出，两边都为空视为相同，
+    再按列取出不一致的行拼成长表。
+    """
+    merged = pd.DataFrame({f'{col}{suffix}': bom[col].iloc[pos].reset_index(drop=True)
+                           for col in columns for suffix, bom, pos in zip(SUFFIXES, (original_bom, new_bom),
+                                                                          (pos1, pos2))})
+    mismatch = diff_columns(merged, columns).to_numpy()
+
+    frames = []
+    for i, col in enumerate(columns):
+        rows = np.flatnonzero(mismatch[:, i])
+        if len(rows):
+            frame = {name: values[rows] for name, values in lead.items()}
+            frame.update({
+                COLUMN: col,
+                OLD_VALUE: merged[f'{col}{SUFFIXES[0]}'].to_numpy(dtype=object)[rows],
+                NEW_VALUE: merged[f'{col}{SUFFIXES[1]}'].to_numpy(dtype=object)[rows],
+            })
+            frames.append(pd.DataFrame(frame))
+    if not frames:
+        return pd.DataFrame(columns=list(lead) + [COLUMN, OLD_VALUE, NEW_VALUE])
+    return pd.concat(frames, ignore_index=True)
+
+
+def compare_boms(original_bom, new_bom, material_column, position_column, other_columns=()):
+    """对比两个版本的 BOM，不依赖页面，可直接用于批量对比和性能测试
+
+    返回包含以下表格的字典：
+    removed_materials / added_materials：只在旧版本 / 新版本中出现的物料编码；
+    positions_added / positions_removed：相同物料新增 / 删除的位置号长表；
+    removed_lines / added_lines：重复物料在旧版本 / 新版本中多出、没有可对应的行；
+    other_diffs：其他列的差异长表。
+    """
+    removed_materials, added_materials = diff_materials(original_bom, new_bom, material_column)
+    positions_added, positions_removed = diff_positions(original_bom, new_bom, material_column, position_column)
+    removed_lines, added_lines = diff_lines(original_bom, new_bom, material_column,
+                                            [position_column] + list(other_columns))
+    return {
+        'removed_materials': removed_materials,
+        'added_materials': added_materials,
+        'removed_lines': removed_lines,
+        'added_lines': added_lines,
+        'positions_added': positions_added,
+        'positions_removed': positions_removed,
+        'other_diffs': diff_other_columns(original_bom, new_bom, material_column, other_columns),
+    }
+
+
+# 多层 BOM 长表中的路径、层级和子树行数列名
+PATH = '路径'
+LEVEL = '层级'
+SUBTREE_ROWS = '子树行数'
+
+# 路径中各层物料之间的分隔符
+PATH_SEPARATOR = ' > '
+
+
+def parse_levels(values):
+    """把层级列解析为整数，支持 1、2、3 和 SAP 导出的 .1、..2 两种写法，无法解析时抛出 ValueError"""
+    if pd.api.types.is_numeric_dtype(values):
+        levels = values
+    else:
+        levels = pd.to_numeric(values.astype(str).str.strip().str.lstrip('.'), errors='coerce')
+    if levels.isna().any():
+        raise ValueError(f"层级列第 {int(np.flatnonzero(levels.isna().to_numpy())[0]) + 2} 行无法解析为层级。")
+    return levels.to_numpy(dtype=np.int64)
+
+
+def canonical_positions(values):
+    """把逗号分隔的位置号整理为去重排序后的文本，位置号顺序不同的两行视为相同"""
+    return pd.Series([', '.join(sorted({position.strip() for position in value.replace('，', ',').split(',')}
+                                       - {''})) if isinstance(value, str) else value
+                      for value in values.to_numpy(dtype=object)], index=values.index, dtype=object)
+
+
+def _mix(hashes):
+    """splitmix64 的混合函数，子树哈希按子项求和前先打散，避免不同子项组合的和相同"""
+    hashes = hashes ^ (hashes >> np.uint64(30))
+    hashes = hashes * np.uint64(0xbf58476d1ce4e5b9)
+    hashes = hashes ^ (hashes >> np.uint64(27))
+    hashes = hashes * np.uint64(0x94d049bb133111eb)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+class BomTree:
+    """按层级列建立的多层 BOM 父子索引
+
+    BOM 按展开顺序排列，每行的父项是它之前最近的上一层的行。节点编号为行号加 1，0 为虚拟的根，
+    各顶层行都是它的子项。子项按父项排序后存成 CSR 索引，任意一组节点的子项可一次取出。
+    每个节点有本行的哈希和包含全部下层行的子树哈希，子树哈希相同的两个节点下层没有任何变化。
+    """
+
+    def __init__(self, bom, material_column, level_column, columns=()):
+        self.bom = bom.reset_index(drop=True)
+        self.material_column = material_column
+        levels = parse_levels(self.bom[level_column])
+        n = len(levels)
+        if n and levels[0] != levels.min():
+            raise ValueError("BOM 的第一行不是最上层，无法按层级建立父子关系。")
+        if (np.diff(levels) > 1).any():
+            row = int(np.flatnonzero(np.diff(levels) > 1)[0]) + 1
+            raise ValueError(f"层级列第 {row + 2} 行比上一行深了不止一层，无法确定父项。")
+
+        # 每行的父项是之前最近的上一层的行，按层在上一层的行号中二分查找
+        parent = np.zeros(n + 1, dtype=np.int64)
+        top = levels.min() if n else 0
+        for level in np.unique(levels):
+            rows = np.flatnonzero(levels == level)
+            if level > top:
+                candidates = np.flatnonzero(levels == level - 1)
+                parent[rows + 1] = candidates[np.searchsorted(candidates, rows) - 1] + 1
+        self.parent = parent
+        self.depth = np.concatenate([[0], levels - top + 1])
+
+        # 子项的 CSR 索引，虚拟的根排在最前
+        self.children = np.argsort(parent[1:], kind='stable') + 1
+        self.offsets = np.searchsorted(parent[1:][self.children - 1], np.arange(n + 2))
+
+        # 同一父项下物料编码相同的子项按出现顺序编号，用于和另一个版本的同一行对应
+        material_codes, _ = pd.factorize(self.bom[material_column], use_na_sentinel=False)
+        self.occurrence = np.concatenate([[0], pd.Series(material_codes).groupby(
+            [parent[1:], material_codes]).cumcount().to_numpy() + 1])
+
+        # 本行的哈希包含物料编码和各对比列，数值统一为浮点数，避免 1 和 1.0 的哈希不同
+        own = self.bom[[material_column] + [col for col in columns if col != material_column]]
+        own = own.apply(lambda col: col.astype(float) if pd.api.types.is_numeric_dtype(col) else col)
+        self.own_hash = np.concatenate([[np.uint64(0)], pd.util.hash_pandas_object(own, index=False).to_numpy()])
+
+        # 从最深的一层往上，子项的子树哈希打散后累加到父项，同时统计子树行数
+        self.subtree_hash = self.own_hash.copy()
+        self.subtree_rows = np.ones(n + 1, dtype=np.int64)
+        child_sum = np.zeros(n + 1, dtype=np.uint64)
+        for depth in range(int(self.depth.max()), 0, -1):
+            nodes = np.flatnonzero(self.depth == depth)
+            self.subtree_hash[nodes] = _mix(self.own_hash[nodes] + child_sum[nodes])
+            np.add.at(child_sum, parent[nodes], _mix(self.subtree_hash[nodes]))
+            np.add.at(self.subtree_rows, parent[nodes], self.subtree_rows[nodes])
+
+    def children_of(self, nodes):
+        """返回 nodes 的全部子项和各子项的父项在 nodes 中的位置"""
+        starts = self.offsets[nodes]
+        counts = self.offsets[nodes + 1] - starts
+        owner = np.repeat(np.arange(len(nodes)), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        return self.children[starts[owner] + np.arange(len(owner)) - first], owner
+
+    def paths(self, nodes):
+        """返回各节点从最上层到本行的物料编码路径，同一父项下重复的物料加上 #序号"""
+        materials = self.bom[self.material_column].to_numpy(dtype=object)
+        segments = []
+        current = np.asarray(nodes)
+        while (current > 0).any():
+            rows = np.maximum(current, 1) - 1
+            segments.append([None if node == 0 else f'{material}#{occurrence}' if occurrence > 1 else str(material)
+                             for node, material, occurrence in zip(current, materials[rows],
+                                                                   self.occurrence[current])])
+            current = self.parent[current]
+        return [PATH_SEPARATOR.join(part for part in reversed(parts) if part is not None)
+                for parts in zip(*segments)] if segments else [''] * len(current)
+
+
+def _match_children(old_tree, new_tree, old_nodes, new_nodes):
+    """把已对应的节点对的子项按 (物料编码, 同名序号) 对应
+
+    返回 (对应的旧节点, 对应的新节点, 只在旧版本的子项, 只在新版本的子项)。
+    """
+    old_children, old_owner = old_tree.children_of(old_nodes)
+    new_children, new_owner = new_tree.children_of(new_nodes)
+    materials = pd.concat([old_tree.bom[old_tree.material_column].iloc[old_children - 1],
+                           new_tree.bom[new_tree.material_column].iloc[new_children - 1]], ignore_index=True)
+    codes, _ = pd.factorize(materials, use_na_sentinel=False)
+    pairs = pd.merge(
+        pd.DataFrame({'owner': old_owner, 'code': codes[:len(old_children)],
+                      'occurrence': old_tree.occurrence[old_children], 'old': old_children}),
+        pd.DataFrame({'owner': new_owner, 'code': codes[len(old_children):],
+                      'occurrence': new_tree.occurrence[new_children], 'new': new_children}),
+        on=['owner', 'code', 'occurrence'], how='outer')
+    matched = pairs['old'].notna() & pairs['new'].notna()
+    return (pairs.loc[matched, 'old'].to_numpy(dtype=np.int64), pairs.loc[matched, 'new'].to_numpy(dtype=np.int64),
+            pairs.loc[pairs['new'].isna(), 'old'].to_numpy(dtype=np.int64),
+            pairs.loc[pairs['old'].isna(), 'new'].to_numpy(dtype=np.int64))
+
+
+def _node_table(tree, nodes):
+    """节点的 (路径, 物料编码, 层级, 子树行数) 表"""
+    return pd.DataFrame({
+        PATH: tree.paths(nodes),
+        tree.material_column: tree.bom[tree.material_column].to_numpy(dtype=object)[nodes - 1],
+        LEVEL: tree.depth[nodes],
+        SUBTREE_ROWS: tree.subtree_rows[nodes],
+    })
+
+
+def compare_bom_trees(original_bom, new_bom, material_column, level_column, position_column=None,
+                      other_columns=()):
+    """按层级对比两个版本的多层 BOM
+
+    两个版本各自建立父子索引，从最上层开始逐层往下，同一父项下的子项按物料编码对应。
+    子树哈希相同的节点对整棵子树都没有变化，直接跳过；只有子树哈希不同的节点对才展开下一层。
+    位置号只调整了顺序的节点对会被展开，但不计入差异。返回包含以下表格的字典：
+    removed_nodes / added_nodes：只在旧版本 / 新版本中出现的节点，整棵子树只列出最上面的一行；
+    attribute_diffs：对应节点的 (路径, 物料编码, 列名, 旧版本值, 新版本值) 差异长表；
+    visited_nodes：实际展开对比的节点对数。
+    """
+    columns = [col for col in ([position_column] if position_column else []) + list(other_columns)
+               if col in original_bom.columns and col in new_bom.columns
+               and col not in (material_column, level_column)]
+    old_tree = BomTree(original_bom, material_column, level_column, columns)
+    new_tree = BomTree(new_bom, material_column, level_column, columns)
+
+    removed, added, changed_old, changed_new = [], [], [], []
+    visited = 0
+    old_nodes = new_nodes = np.zeros(1, dtype=np.int64)
+    while len(old_nodes):
+        old_nodes, new_nodes, only_old, only_new = _match_children(old_tree, new_tree, old_nodes, new_nodes)
+        removed.append(only_old)
+        added.append(only_new)
+        visited += len(old_nodes)
+        own_changed = old_tree.own_hash[old_nodes] != new_tree.own_hash[new_nodes]
+        changed_old.append(old_nodes[own_changed])
+        changed_new.append(new_nodes[own_changed])
+        # 子树没有变化的节点对不再往下展开
+        expand = old_tree.subtree_hash[old_nodes] != new_tree.subtree_hash[new_nodes]
+        old_nodes, new_nodes = old_nodes[expand], new_nodes[expand]
+
+    changed_old = np.concatenate(changed_old)
+    changed_new = np.concatenate(changed_new)
+    lead = {PATH: np.array(new_tree.paths(changed_new), dtype=object),
+            material_column: new_tree.bom[material_column].to_numpy(dtype=object)[changed_new - 1]}
+    attribute_diffs = _long_diffs(old_tree.bom, new_tree.bom, changed_old - 1, changed_new - 1, columns, lead)
+    if position_column in columns:
+        # 哈希按原文计算，位置号只在差异行上整理后再比较，只是顺序不同的不算差异
+        positions = attribute_diffs[COLUMN] == position_column
+        same = canonical_positions(attribute_diffs.loc[positions, OLD_VALUE]) == \
+            canonical_positions(attribute_diffs.loc[positions, NEW_VALUE])
+        attribute_diffs = attribute_diffs.drop(index=same[same].index).reset_index(drop=True)
+    return {
+        'removed_nodes': _node_table(old_tree, np.sort(np.concatenate(removed))),
+        'added_nodes': _node_table(new_tree, np.sort(np.concatenate(added))),
+        'attribute_diffs': attribute_diffs,
+        'visited_nodes': visited,
+    }
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+# 合并后两个表格同名列的后缀
+SUFFIXES = ('_A', '_B')
+
+
+def values_equal(a, b):
+    """逐行比较两列的值，两边都为空视为相等"""
+    try:
+        equal = a.eq(b)
+    except TypeError:
+        # 类别不同的 Categorical 等无法直接比较，转为 object 再比较
+        equal = a.astype(object).eq(b.astype(object))
+    equal = equal.fillna(False).to_numpy(dtype=bool)
+    return equal | (a.isna().to_numpy() & b.isna().to_numpy())
+
+
+def diff_columns(merged_df, columns):
+    """一次性计算各列的不一致矩阵，True 表示该行该列两边的值不同"""
+    col_a, col_b = SUFFIXES
+    return pd.DataFrame(
+        {col: ~values_equal(merged_df[f'{col}{col_a}'], merged_df[f'{col}{col_b}']) for col in columns},
+        index=merged_df.index, columns=list(columns), dtype=bool)
+
+
+class KeyIndex:
+    """两个表格主键的整数编码索引
+
+    每个主键组合在两个表格间编码为同一个整数，拆分独有行、关联共同行和检查主键唯一性都基于
+    这组编码完成，只需按列各做一次哈希编码，与主键列数成线性关系。
+    """
+
+    def __init__(self, df1, df2, primary_keys):
+        self.primary_keys = list(primary_keys)
+        n1 = len(df1)
+        codes = np.zeros(n1 + len(df2), dtype=np.int64)
+        has_null = np.zeros(n1 + len(df2), dtype=bool)
+        for key in self.primary_keys:
+            values = pd.concat([df1[key], df2[key]], ignore_index=True)
+            has_null |= values.isna().to_numpy()
+            # 与 pd.merge 一致，两边的空值视为相同的键
+            col_codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            codes, _ = pd.factorize(codes * len(uniques) + col_codes)
+        self.n_keys = int(codes.max()) + 1 if len(codes) else 0
+        self.codes1 = codes[:n1]
+        self.codes2 = codes[n1:]
+
+        counts1 = np.bincount(self.codes1, minlength=self.n_keys)
+        counts2 = np.bincount(self.codes2, minlength=self.n_keys)
+        # 与 groupby 一致，主键含空值的行不参与唯一性检查
+        self.unique1 = not (np.bincount(self.codes1[~has_null[:n1]], minlength=self.n_keys) > 1).any()
+        self.unique2 = not (np.bincount(self.codes2[~has_null[n1:]], minlength=self.n_keys) > 1).any()
+        # 关联时空值的键仍视为相同，第二个表格的键全部不重复时才能按位置直接对应
+        self._codes2_distinct = not (counts2 > 1).any()
+        # 各行的键是否在另一个表格中出现
+        self.in_both1 = counts2[self.codes1] > 0
+        self.in_both2 = counts1[self.codes2] > 0
+
+    def aligned_positions(self):
+        """返回两个表格中主键相同的行号对，顺序与 pd.merge 的 inner 关联一致"""
+        if self._codes2_distinct:
+            pos1 = np.flatnonzero(self.in_both1)
+            position_of_key = np.full(self.n_keys, -1, dtype=np.int64)
+            position_of_key[self.codes2] = np.arange(len(self.codes2))
+            return pos1, position_of_key[self.codes1[pos1]]
+        # 第二个表格主键重复时按编码做一次整数关联
+        pairs = pd.merge(pd.DataFrame({'key': self.codes1, 'pos1': np.arange(len(self.codes1))}),
+                         pd.DataFrame({'key': self.codes2, 'pos2': np.arange(len(self.codes2))}), on='key')
+        return pairs['pos1'].to_numpy(), pairs['pos2'].to_numpy()
+
+    def merge(self, df1, df2):
+        """按主键关联两个表格的共同行，列的顺序和后缀与 pd.merge 一致"""
+        pos1, pos2 = self.aligned_positions()
+        left = df1.iloc[pos1].reset_index(drop=True)
+        right = df2.iloc[pos2].drop(columns=self.primary_keys).reset_index(drop=True)
+        overlap = [col for col in right.columns if col in left.columns]
+        left = left.rename(columns={col: f'{col}{SUFFIXES[0]}' for col in overlap})
+        right = right.rename(columns={col: f'{col}{SUFFIXES[1]}' for col in overlap})
+        return pd.concat([left, right], axis=1)
+
+    def split_only(self, df1, df2):
+        """返回只在第一个表格和只在第二个表格中出现的行"""
+        return df1[~self.in_both1], df2[~self.in_both2]
+
+
+class AlignedCompare:
+    """按主键对齐的两个表格的对比
+
+    主键关联的结果和两边独有的行在第一次对比时计算后保留，各列的不一致向量按列缓存，
+    更换对比列时只计算新增的列，去掉的列直接丢弃。
+    """
+
+    def __init__(self, df1, df2, primary_keys, key_index=None):
+        self.df1 = df1
+        self.df2 = df2
+        self.key_index = key_index if key_index is not None else KeyIndex(df1, df2, primary_keys)
+        self._merged_df = None
+        self._only = None
+        self._column_diffs = {}
+
+    def compare(self, selected_columns):
+        """对比 selected_columns，返回值与 compare_frames 相同"""
+        primary_keys = self.key_index.primary_keys
+        if self._merged_df is None:
+            # 只列出两个 Excel 主键可关联到的行
+            self._merged_df = self.key_index.merge(self.df1, self.df2)
+            # 第一个表格有第二个表格没有的数据，第二个表格有第一个表格没有的数据
+            self._only = self.key_index.split_only(self.df1, self.df2)
+
+        # 只保留共有的列且排除主键
+        common_columns = [col for col in selected_columns if
+                          col in self.df1.columns and col in self.df2.columns and col not in primary_keys]
+
+        new_columns = [col for col in common_columns if col not in self._column_diffs]
+        if new_columns:
+            diffs = diff_columns(self._merged_df, new_columns)
+            self._column_diffs.update({col: diffs[col].to_numpy() for col in new_columns})
+        self._column_diffs = {col: self._column_diffs[col] for col in common_columns}
+        mismatch = pd.DataFrame(self._column_diffs, index=self._merged_df.index, columns=common_columns, dtype=bool)
+
+        # 由不一致矩阵得到每行的对比结果，缓存的关联结果不修改
+        merged_df = self._merged_df.copy(deep=False)
+        merged_df['比对结果'] = np.where(mismatch.any(axis=1), 'N', 'Y')
+
+        df1_only, df2_only = self._only
+        return merged_df, df1_only, df2_only, mismatch
+
+
+def compare_frames(df1, df2, primary_keys, selected_columns, key_index=None):
+    """按主键对比两个表格
+
+    返回 (merged_df, df1_only, df2_only, mismatch)，mismatch 为共同行各对比列的不一致矩阵，
+    mismatch.sum() 即各列不一致的行数。已构建的 key_index 可传入复用。
+    """
+    return AlignedCompare(df1, df2, primary_keys, key_index).compare(selected_columns)
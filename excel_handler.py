@@ -1,27 +1,78 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 
+from excel_loader import load_excel, read_excel_preview
 
-def get_column_type(series):
-    # 先尝试判断是否为日期或时间日期类型
+
+# 类型推断时先检查的样本行数
+SAMPLE_SIZE = 1000
+
+
+def _datetime_type(parsed):
+    """根据解析后的日期是否带有时间部分区分日期与时间日期"""
+    if (parsed != parsed.dt.normalize()).any():
+        return '时间日期类型'
+    return '日期类型'
+
+
+def _parse_dates(values):
+    """把文本解析为日期，无法解析的值为空；整列无法统一解析（如混合了不同时区偏移）时返回 None"""
     try:
-        pd.to_datetime(series, errors='raise')
-        if series.astype(str).str.contains(' ').any():
-            return '时间日期类型'
-        return '日期类型'
+        return pd.to_datetime(values, errors='coerce', format='mixed')
     except (ValueError, TypeError):
-        pass
+        return None
+
 
-    # 判断是否为数字类型
-    if pd.to_numeric(series, errors='coerce').notnull().all() and np.issubdtype(
-            pd.to_numeric(series, errors='coerce').dtype, np.number):
+def _infer_type(values):
+    """对非空值推断类型：先检查样本，必要时才对整列做一次解析"""
+    if values.empty or pd.api.types.is_bool_dtype(values):
+        return '文本类型'
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return _datetime_type(values)
+    if pd.api.types.is_numeric_dtype(values):
         return '数字类型'
 
-    # 其他情况为文本类型
+    # 文本列：先用样本判断可能的类型，样本不满足时直接判定为文本
+    sample = values.head(SAMPLE_SIZE)
+    is_complete = len(sample) == len(values)
+    if pd.to_numeric(sample, errors='coerce').notna().all():
+        # 样本全部为数字时才对整列解析一次
+        if is_complete or pd.to_numeric(values, errors='coerce').notna().all():
+            return '数字类型'
+        return '文本类型'
+
+    parsed = _parse_dates(sample)
+    if parsed is not None and parsed.notna().all():
+        # 样本全部为日期时才对整列解析一次
+        if not is_complete:
+            parsed = _parse_dates(values)
+            if parsed is None or parsed.isna().any():
+                return '文本类型'
+        return _datetime_type(parsed)
+
     return '文本类型'
 
 
+def get_column_type(series):
+    """判断列的基本类型，空值不参与判断"""
+    return _infer_type(series.dropna())
+
+
+def profile_columns(df):
+    """生成各列的类型、空值占比和不同值个数"""
+    rows = []
+    for col in df.columns:
+        series = df[col]
+        values = series.dropna()
+        rows.append({
+            '列名': col,
+            '基本类型': _infer_type(values),
+            '空值占比': round(1 - len(values) / len(series), 4) if len(series) else 0.0,
+            '不同值个数': values.nunique(),
+        })
+    return pd.DataFrame(rows, columns=['列名', '基本类型', '空值占比', '不同值个数'])
+
+
 # 设置页面标题
 st.title('Excel 文件列信息与前 10 行数据展示')
 
@@ -30,22 +81,19 @@ uploaded_file = st.file_uploader("请上传 Excel 文件", type=['xlsx', 'xls'])
 
 if uploaded_file is not None:
     try:
-        # 读取 Excel 文件
-        df = pd.read_excel(uploaded_file)
-
-        # 获取列名和对应的基本类型
-        column_info = {
-            '列名': df.columns.tolist(),
-            '基本类型': [get_column_type(df[col]) for col in df.columns]
-        }
-        column_info_df = pd.DataFrame(column_info)
-
-        # 展示列信息
+        # 先占位列信息，保持页面上的展示顺序
         st.subheader('Excel 文件各列及对应基本类型信息')
-        st.dataframe(column_info_df)
+        column_info_placeholder = st.empty()
 
-        # 展示前 10 行数据
+        # 只读取前 10 行数据并立即展示
         st.subheader('表格的前 10 行数据')
-        st.dataframe(df.head(10))
+        st.dataframe(read_excel_preview(uploaded_file, nrows=10))
+
+        # 列类型需要全部数据，预览展示后再读取完整文件
+        with column_info_placeholder:
+            with st.spinner('正在分析各列类型...'):
+                df = load_excel(uploaded_file)
+                column_info_df = profile_columns(df)
+            st.dataframe(column_info_df)
     except Exception as e:
         st.error(f"处理文件时出现错误: {e}")
@@ -0,0 +1,519 @@
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import pickle
+import posixpath
+import sys
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
+from xml.etree.ElementTree import ParseError, iterparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from pandas.io.parsers import TextParser
+from pyarrow import feather
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+logger = logging.getLogger(__name__)
+
+# 预览默认读取的数据行数
+PREVIEW_ROWS = 10
+
+# 大文件流式读取时每块的行数
+# 共享字符串表不分块，会整体读入内存，不重复文本很多的文件内存占用仍随文件大小增长
+CHUNK_ROWS = 50000
+
+# 可选的解析后端及对应的 pandas engine，None 表示由 pandas 按文件格式选择（xlsx 为 openpyxl）
+READER_BACKENDS = {
+    'calamine': 'calamine',
+    'openpyxl': None,
+}
+
+# 解析结果缓存的内存上限（字节），所有会话共用
+CACHE_MAX_BYTES = int(os.environ.get('EXCEL_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_cache_lock = threading.Lock()
+
+# 不重复值个数不超过行数的该比例的文本列在加载时转换为分类类型
+CATEGORY_MAX_RATIO = float(os.environ.get('EXCEL_CATEGORY_MAX_RATIO', 0.5))
+
+# 上传文件 ID 到内容哈希的映射，避免每次重跑都重新计算哈希
+_digests = OrderedDict()
+_DIGEST_MEMO_SIZE = 256
+
+
+def available_backends():
+    """返回当前环境可用的解析后端，按优先级排列"""
+    backends = []
+    pandas_version = tuple(int(part) for part in pd.__version__.split('.')[:2])
+    # calamine 是 Rust 实现的原生解析器，需要 pandas 2.2 及以上
+    if pandas_version >= (2, 2) and importlib.util.find_spec('python_calamine') is not None:
+        backends.append('calamine')
+    backends.append('openpyxl')
+    return backends
+
+
+def default_backend():
+    """默认使用最快的可用后端，可通过环境变量 EXCEL_READER_BACKEND 指定"""
+    backend = os.environ.get('EXCEL_READER_BACKEND')
+    if backend in available_backends():
+        return backend
+    return available_backends()[0]
+
+
+def read_excel(source, backend=None, **kwargs):
+    """通过选定的解析后端读取 Excel，参数与 pd.read_excel 一致"""
+    engine = READER_BACKENDS[backend or default_backend()]
+    return pd.read_excel(source, engine=engine, **kwargs)
+
+
+def _local_name(tag):
+    """去掉 XML 标签或属性的命名空间"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _first_sheet_path(archive):
+    """找到工作簿中第一个工作表的 XML 路径，以及是否使用 1904 日期系统"""
+    sheet_rel_id = None
+    date1904 = False
+    for _, elem in iterparse(archive.open('xl/workbook.xml')):
+        name = _local_name(elem.tag)
+        if name == 'workbookPr':
+            date1904 = elem.get('date1904') in ('1', 'true')
+        elif name == 'sheet' and sheet_rel_id is None:
+            sheet_rel_id = next((value for key, value in elem.attrib.items() if _local_name(key) == 'id'), None)
+    if sheet_rel_id is None:
+        raise ValueError('工作簿中没有工作表')
+
+    for _, elem in iterparse(archive.open('xl/_rels/workbook.xml.rels')):
+        if _local_name(elem.tag) == 'Relationship' and elem.get('Id') == sheet_rel_id:
+            target = elem.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/'), date1904
+            return posixpath.normpath(posixpath.join('xl', target)), date1904
+    raise ValueError('找不到工作表文件')
+
+
+def _date_styles(archive):
+    """返回属于日期格式的单元格样式序号到是否为时长格式（如 [h]:mm:ss）的映射"""
+    if 'xl/styles.xml' not in archive.namelist():
+        return {}
+    custom_formats = {}
+    date_styles = {}
+    in_cell_xfs = False
+    style_index = 0
+    for event, elem in iterparse(archive.open('xl/styles.xml'), events=('start', 'end')):
+        name = _local_name(elem.tag)
+        if event == 'start':
+            if name == 'cellXfs':
+                in_cell_xfs = True
+            continue
+        if name == 'numFmt':
+            custom_formats[int(elem.get('numFmtId'))] = elem.get('formatCode')
+        elif name == 'cellXfs':
+            in_cell_xfs = False
+        elif name == 'xf' and in_cell_xfs:
+            fmt_id = int(elem.get('numFmtId', 0))
+            fmt = custom_formats.get(fmt_id, BUILTIN_FORMATS.get(fmt_id))
+            if fmt and is_date_format(fmt):
+                date_styles[style_index] = is_timedelta_format(fmt)
+            style_index += 1
+    return date_styles
+
+
+def _shared_strings(archive, max_index):
+    """只读取到需要的最大序号为止的共享字符串"""
+    strings = []
+    if max_index < 0 or 'xl/sharedStrings.xml' not in archive.namelist():
+        return strings
+    for _, elem in iterparse(archive.open('xl/sharedStrings.xml')):
+        if _local_name(elem.tag) != 'si':
+            continue
+        # 拼接富文本的各段文字，忽略拼音注释
+        phonetic = {t for child in elem if _local_name(child.tag) == 'rPh' for t in child}
+        strings.append(''.join(t.text or '' for t in elem.iter() if _local_name(t.tag) == 't' and t not in phonetic))
+        elem.clear()
+        if len(strings) > max_index:
+            break
+    return strings
+
+
+def _cell_value(cell, date_styles, calendar):
+    """把单元格 XML 转成 Python 值，共享字符串先保留为序号"""
+    cell_type = cell.get('t', 'n')
+    value = None
+    for child in cell:
+        name = _local_name(child.tag)
+        if name == 'v':
+            value = child.text
+        elif name == 'is':
+            value = ''.join(t.text or '' for t in child.iter() if _local_name(t.tag) == 't')
+    if value is None:
+        return None
+    if cell_type == 's':
+        return _SharedString(int(value))
+    if cell_type in ('str', 'inlineStr'):
+        return value
+    if cell_type == 'b':
+        return value == '1'
+    if cell_type == 'e':
+        return None
+    if cell_type == 'd':
+        return datetime.fromisoformat(value.rstrip('Z'))
+    number = float(value) if any(ch in value for ch in '.eE') else int(value)
+    style = int(cell.get('s', 0))
+    if style in date_styles:
+        # 时长格式与 openpyxl 一致解析为 timedelta
+        return from_excel(number, calendar, timedelta=date_styles[style])
+    return number
+
+
+class _SharedString(int):
+    """尚未替换为文本的共享字符串序号"""
+
+
+def _iter_sheet_rows(archive, sheet_path, date_styles, calendar):
+    """逐行读取工作表，按行号补齐中间缺失的空行，共享字符串保留为序号"""
+    row_count = 0
+    sheet_data = None
+    for event, elem in iterparse(archive.open(sheet_path), events=('start', 'end')):
+        name = _local_name(elem.tag)
+        if event == 'start':
+            if name == 'sheetData':
+                sheet_data = elem
+            continue
+        if name != 'row':
+            continue
+        row_number = int(elem.get('r', row_count + 1))
+        for _ in range(row_number - 1 - row_count):
+            yield []
+        row = []
+        for cell in elem:
+            if _local_name(cell.tag) != 'c':
+                continue
+            ref = cell.get('r')
+            col_idx = column_index_from_string(coordinate_from_string(ref)[0]) - 1 if ref else len(row)
+            row.extend([None] * (col_idx - len(row)))
+            row.append(_cell_value(cell, date_styles, calendar))
+        # 已处理的行从树中移除，内存占用不随行数增长
+        if sheet_data is not None:
+            sheet_data.clear()
+        # 与 pandas 一致：去掉行尾空单元格
+        while row and row[-1] is None:
+            row.pop()
+        row_count = row_number
+        yield row
+
+
+def _stream_rows(data, max_rows):
+    """流式读取第一个工作表的前 max_rows 行"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        sheet_path, date1904 = _first_sheet_path(archive)
+        calendar = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+        rows = list(islice(_iter_sheet_rows(archive, sheet_path, _date_styles(archive), calendar), max_rows))
+
+        # 与 pandas 一致：去掉末尾的空行
+        while rows and not rows[-1]:
+            rows.pop()
+        indices = [value for row in rows for value in row if isinstance(value, _SharedString)]
+        strings = _shared_strings(archive, max(indices, default=-1))
+    return [[strings[value] if isinstance(value, _SharedString) else value for value in row] for row in rows]
+
+
+def _header_columns(header, width):
+    """按 pandas 的规则生成列名：空列名为 Unnamed: i，重名的加 .1、.2 后缀"""
+    header = list(header) + [None] * (width - len(header))
+    columns = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name is None or name == '':
+            name = f'Unnamed: {i}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def _rows_to_frame(rows, columns=None):
+    """按 pandas 的表头规则把行列表转换为 DataFrame，给定 columns 时 rows 不含表头
+
+    与 pd.read_excel 一样交给 TextParser 推断各列类型，按文本保存的数字（如 '001'）在整列都是数字时转换为数值。
+    """
+    if columns is None:
+        if not rows:
+            return pd.DataFrame()
+        columns = _header_columns(rows[0], max(len(row) for row in rows))
+        rows = rows[1:]
+    width = len(columns)
+    data = [[np.nan if value is None else value for value in row[:width]] + [np.nan] * (width - len(row))
+            for row in rows]
+    if not data:
+        return pd.DataFrame(columns=columns)
+    return TextParser(data, names=columns, header=None, skip_blank_lines=False).read()
+
+
+def iter_excel_chunks(uploaded_file, chunk_rows=CHUNK_ROWS):
+    """流式读取第一个工作表，每次返回最多 chunk_rows 行的 DataFrame
+
+    只有共享字符串表常驻内存，工作表按块解析，适合整体放不下内存的大文件。
+    列以表头为准，超出表头宽度的单元格会被忽略；各块的数据类型分别推断。
+    """
+    data = uploaded_file.getvalue()
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        sheet_path, date1904 = _first_sheet_path(archive)
+    except (zipfile.BadZipFile, KeyError, ValueError, ParseError):
+        # 非 xlsx 格式（如 xls）无法流式读取，整体读取后再分块
+        df = read_excel(io.BytesIO(data))
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+
+    with archive:
+        calendar = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+        strings = _shared_strings(archive, sys.maxsize)
+        rows = _iter_sheet_rows(archive, sheet_path, _date_styles(archive), calendar)
+        header = [strings[value] if isinstance(value, _SharedString) else value for value in next(rows, [])]
+        width = len(header)
+        if not header:
+            # 第一行为空（表头前有空行）时与 pd.read_excel 一致：列名为 Unnamed: i，列数取最宽的一行，前面的空行作为数据行
+            width = max((len(row) for row in _iter_sheet_rows(archive, sheet_path, {}, calendar)), default=0)
+        columns = _header_columns(header, width)
+
+        chunk = []
+        blank_rows = 0
+        yielded = False
+        for row in rows:
+            # 空行先计数，后面还有数据时才补上，与 pandas 一致去掉末尾的空行
+            if not row:
+                blank_rows += 1
+                continue
+            chunk.extend([] for _ in range(blank_rows))
+            blank_rows = 0
+            chunk.append([strings[value] if isinstance(value, _SharedString) else value for value in row])
+            if len(chunk) >= chunk_rows:
+                yield _rows_to_frame(chunk, columns)
+                chunk = []
+                yielded = True
+        if chunk or not yielded:
+            yield _rows_to_frame(chunk, columns)
+
+
+def read_excel_preview(uploaded_file, nrows=PREVIEW_ROWS):
+    """只流式读取表头和前 nrows 行，用于快速预览"""
+    data = uploaded_file.getvalue()
+    try:
+        return _rows_to_frame(_stream_rows(data, nrows + 1))
+    except (zipfile.BadZipFile, KeyError, ValueError, ParseError):
+        # 非 xlsx 格式（如 xls）时退回解析后端读取
+        return read_excel(io.BytesIO(data), nrows=nrows)
+
+
+def file_digest(uploaded_file):
+    """计算上传文件内容的哈希，同一次上传只计算一次"""
+    file_id = getattr(uploaded_file, 'file_id', None)
+    with _cache_lock:
+        if file_id is not None and file_id in _digests:
+            _digests.move_to_end(file_id)
+            return _digests[file_id]
+    digest = hashlib.blake2b(uploaded_file.getvalue(), digest_size=16).hexdigest()
+    if file_id is not None:
+        with _cache_lock:
+            _digests[file_id] = digest
+            while len(_digests) > _DIGEST_MEMO_SIZE:
+                _digests.popitem(last=False)
+    return digest
+
+
+def _parse_excel(uploaded_file):
+    return read_excel(io.BytesIO(uploaded_file.getvalue()))
+
+
+def _load(uploaded_file, compact):
+    """读取完整的工作表并按 (文件内容哈希, 是否压缩) 缓存，返回 (DataFrame, 压缩前字节数, 占用字节数)"""
+    global _cache_bytes
+    digest = file_digest(uploaded_file)
+    key = (digest, compact)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _cache_stats['hits'] += 1
+            logger.debug('Excel 解析缓存命中：%s', cache_stats())
+            return _cache[key]
+        _cache_stats['misses'] += 1
+        # 未压缩的结果已缓存时直接在其基础上压缩，不再解析
+        parsed = _cache.get((digest, False)) if compact else None
+
+    df = parsed[0] if parsed else _parse_excel(uploaded_file)
+    if compact:
+        # 缓存中只保留压缩后的结果
+        entry = compact_frame(df)
+    else:
+        nbytes = int(df.memory_usage(deep=True).sum())
+        entry = (df, nbytes, nbytes)
+    nbytes = entry[2]
+    if nbytes > CACHE_MAX_BYTES:
+        return entry
+
+    with _cache_lock:
+        if key not in _cache:
+            _cache[key] = entry
+            _cache_bytes += nbytes
+        # 超出内存上限时淘汰最久未使用的结果
+        while _cache_bytes > CACHE_MAX_BYTES:
+            _, (_, _, evicted_bytes) = _cache.popitem(last=False)
+            _cache_bytes -= evicted_bytes
+            _cache_stats['evictions'] += 1
+        logger.debug('Excel 解析缓存未命中：%s', cache_stats())
+    return entry
+
+
+def load_excel(uploaded_file):
+    """读取完整的工作表，按文件内容哈希缓存解析结果
+
+    返回的 DataFrame 在各页面和会话间共享，需要修改时请先 copy()。
+    """
+    return _load(uploaded_file, compact=False)[0]
+
+
+def cache_stats():
+    """返回解析缓存的命中、未命中、淘汰次数及当前占用"""
+    return dict(_cache_stats, entries=len(_cache), bytes=_cache_bytes)
+
+
+def compact_frame(df, max_ratio=CATEGORY_MAX_RATIO):
+    """压缩 DataFrame 的内存占用，返回 (压缩后的 DataFrame, 压缩前字节数, 压缩后字节数)，不修改 df
+
+    低基数的文本列转换为分类类型，不重复的文本只保存一份，各行只保存整数编码，分组、isin 等操作都在编码上进行，
+    类别按文本排序，与按文本分组的顺序一致；整数列缩小为能容纳全部值的最小整数类型。
+    浮点列缩小为 float32 会损失精度，保持不变。
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    compact = df.copy(deep=False)
+    for i in range(df.shape[1]):
+        values = df.iloc[:, i]
+        if pd.api.types.is_integer_dtype(values) and not isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+            compact.isetitem(i, pd.to_numeric(values, downcast='integer'))
+        elif len(values) and pd.api.types.infer_dtype(values, skipna=True) == 'string':
+            codes, uniques = pd.factorize(values, sort=True)
+            if len(uniques) <= max_ratio * len(values):
+                compact.isetitem(i, pd.Series(pd.Categorical.from_codes(codes, uniques), index=values.index,
+                                              name=values.name))
+    after = int(compact.memory_usage(deep=True).sum())
+    return compact, before, after
+
+
+def load_compact_excel(uploaded_file):
+    """读取完整的工作表并压缩列类型，返回 (DataFrame, 压缩前字节数, 压缩后字节数)
+
+    与 load_excel 共用解析缓存，缓存中只保留压缩后的 DataFrame，不同时保留未压缩的版本。
+    返回的 DataFrame 在各页面和会话间共享，需要修改时请先 copy()。
+    """
+    return _load(uploaded_file, compact=True)
+
+
+def spill_dir():
+    """当前会话的临时目录，会话结束后随 session_state 一起清理"""
+    if '_excel_spill_dir' not in st.session_state:
+        st.session_state['_excel_spill_dir'] = tempfile.TemporaryDirectory(prefix='streamlit_play_')
+    return st.session_state['_excel_spill_dir'].name
+
+
+def _spill(uploaded_file):
+    """把上传文件转换为列式 Arrow 文件，每个文件只转换一次
+
+    无法转换为 Arrow 的混合类型列和超大整数列单独 pickle 保存，保证读回的值与 pandas 读取的一致。
+    """
+    key = file_digest(uploaded_file)
+    base = os.path.join(spill_dir(), key)
+    meta_path = base + '.meta.pkl'
+    if os.path.exists(meta_path):
+        with open(meta_path, 'rb') as f:
+            return base, pickle.load(f)
+
+    # 已解析过的直接复用，否则只为转换解析一次，不放入内存缓存
+    with _cache_lock:
+        cached = _cache.get((key, True)) or _cache.get((key, False))
+    df = cached[0] if cached else _parse_excel(uploaded_file)
+    # 分类列写为 Arrow 字典编码，读回时仍为分类类型；缓存的结果已压缩时，压缩前的大小取缓存中记录的值
+    df, before, after = compact_frame(df)
+    if cached:
+        before = cached[1]
+
+    arrays, names, pickled = [], [], []
+    for i, col in enumerate(df.columns):
+        try:
+            arrays.append(pa.array(df[col], from_pandas=True))
+            names.append(f'c{i}')
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+            # 超出 int64 的整数（如按文本保存的 20 位发票号被 pandas 转为整数）也无法转换
+            df[col].reset_index(drop=True).to_pickle(f'{base}.c{i}.pkl')
+            pickled.append(i)
+    feather.write_feather(pa.table(arrays, names=names), base + '.arrow', compression='uncompressed')
+
+    # 元信息最后写入，存在即表示转换完成
+    meta = {'columns': list(df.columns), 'pickled': set(pickled), 'memory': (before, after)}
+    with open(meta_path + '.tmp', 'wb') as f:
+        pickle.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return base, meta
+
+
+def excel_columns(uploaded_file):
+    """返回上传文件的全部列名"""
+    return list(_spill(uploaded_file)[1]['columns'])
+
+
+def memory_usage(uploaded_file):
+    """返回加载时压缩列类型前后整张表的内存占用 (压缩前字节数, 压缩后字节数)"""
+    return _spill(uploaded_file)[1]['memory']
+
+
+def load_columns(uploaded_file, columns=None, rows=None):
+    """以内存映射方式只读取需要的列（和行），不在内存中保留完整的 DataFrame
+
+    rows 为行号列表，返回结果的索引与 load_excel 读取的完整 DataFrame 一致。
+    """
+    base, meta = _spill(uploaded_file)
+    names = meta['columns']
+    if columns is None:
+        columns = names
+    missing = [col for col in columns if col not in names]
+    if missing:
+        raise KeyError(f'列不存在: {missing}')
+    positions = [names.index(col) for col in columns]
+
+    table = pa.ipc.open_file(pa.memory_map(base + '.arrow')).read_all()
+    table = table.select([f'c{pos}' for pos in positions if pos not in meta['pickled']])
+    if rows is not None:
+        rows = np.asarray(rows, dtype=np.int64)
+        table = table.take(rows)
+    arrow_df = table.to_pandas(split_blocks=True)
+
+    data = {}
+    for col, pos in zip(columns, positions):
+        if pos in meta['pickled']:
+            series = pd.read_pickle(f'{base}.c{pos}.pkl')
+            data[col] = series if rows is None else series.iloc[rows].reset_index(drop=True)
+        else:
+            data[col] = arrow_df[f'c{pos}']
+    df = pd.DataFrame(data, columns=columns)
+    if rows is not None:
+        df.index = rows
+    return df
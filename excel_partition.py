@@ -0,0 +1,146 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from excel_diff import KeyIndex, compare_frames
+from excel_loader import iter_excel_chunks
+from excel_report import ReportWriter
+
+# 按主键哈希分区的个数，对比时每次只把一个分区两边的数据读入内存
+PARTITION_COUNT = 32
+
+# 对比概要中保留用于页面预览的不一致行数上限
+PREVIEW_MISMATCH_ROWS = 1000
+
+
+def _key_hash(values):
+    """主键列各值的哈希
+
+    各块的数据类型是分别推断的，同一个键可能一块中为 1、另一块中为 1.0，数值统一按浮点数计算哈希，
+    其余值按文本计算，空值的哈希固定为 0。不同的键落在同一分区不影响结果。
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        hashes = pd.util.hash_array(values.to_numpy(dtype=float, na_value=np.nan))
+    else:
+        values = values.astype(object)
+        hashes = pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+        numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+        is_number = ~np.isnan(numbers)
+        hashes[is_number] = pd.util.hash_array(numbers[is_number])
+    hashes[values.isna().to_numpy()] = 0
+    return hashes
+
+
+def key_partitions(df, primary_keys, n_partitions):
+    """计算各行所属的分区，主键相同的行总在同一分区"""
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for key in primary_keys:
+        hashes = hashes * np.uint64(1000003) + _key_hash(df[key])
+    return (hashes % np.uint64(n_partitions)).astype(np.int64)
+
+
+class _PartitionFiles:
+    """把各块数据按分区追加写入磁盘上的临时文件"""
+
+    def __init__(self, directory, name, n_partitions):
+        self.columns = None
+        self.paths = [os.path.join(directory, f'{name}.{i}.pkl') for i in range(n_partitions)]
+        self._files = [open(path, 'wb') for path in self.paths]
+
+    def append(self, df, partitions):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        order = np.argsort(partitions, kind='stable')
+        bounds = np.searchsorted(partitions[order], np.arange(len(self.paths) + 1))
+        for i, part in enumerate(self._files):
+            if bounds[i] < bounds[i + 1]:
+                pickle.dump(df.iloc[order[bounds[i]:bounds[i + 1]]], part, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        for part in self._files:
+            part.close()
+
+    def read(self, i):
+        """读回一个分区的全部数据"""
+        frames = []
+        with open(self.paths[i], 'rb') as part:
+            while True:
+                try:
+                    frames.append(pickle.load(part))
+                except EOFError:
+                    break
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)
+
+
+def compare_partitioned(file1, file2, primary_keys, selected_columns, output, n_partitions=PARTITION_COUNT,
+                        progress=None):
+    """分区对比两个大文件，对比结果增量写入 output 的 Excel 报告
+
+    两个文件按块流式读取，按主键哈希写入磁盘上的分区文件，再逐个分区读回对比，内存中只有一个分区的数据。
+    报告中的行按分区顺序排列。主键不唯一时抛出 ValueError。
+    progress(比例, 说明) 用于报告进度。
+    返回对比概要：共同行数、不一致行数、各列不一致行数、两边独有的行数和部分不一致行的预览。
+    """
+    progress = progress or (lambda value, text: None)
+    with tempfile.TemporaryDirectory() as directory:
+        stores = []
+        for name, uploaded_file in (('a', file1), ('b', file2)):
+            store = _PartitionFiles(directory, name, n_partitions)
+            rows = 0
+            try:
+                for chunk in iter_excel_chunks(uploaded_file):
+                    store.append(chunk, key_partitions(chunk, primary_keys, n_partitions))
+                    rows += len(chunk)
+                    progress(0.0, f"正在读取并分区 {uploaded_file.name}：{rows} 行")
+            finally:
+                store.close()
+            stores.append(store)
+
+        summary = {'total_rows': 0, 'mismatch_rows': 0, 'mismatch_counts': None, 'df1_only_rows': 0,
+                   'df2_only_rows': 0}
+        previews = []
+        preview_masks = []
+        preview_rows = 0
+        writer = ReportWriter(output)
+        for i in range(n_partitions):
+            progress(i / n_partitions, f"正在对比第 {i + 1}/{n_partitions} 个分区")
+            df1 = stores[0].read(i)
+            df2 = stores[1].read(i)
+            key_index = KeyIndex(df1, df2, primary_keys)
+            if not (key_index.unique1 and key_index.unique2):
+                raise ValueError("选择的主键在表格中不唯一，请重新选择主键。")
+            result_df, df1_only, df2_only, mismatch = compare_frames(df1, df2, primary_keys, selected_columns,
+                                                                     key_index)
+            del df1, df2
+
+            writer.write_frame('对比结果', result_df, mismatch)
+            writer.write_frame('第一个表格独有的数据', df1_only)
+            writer.write_frame('第二个表格独有的数据', df2_only)
+
+            mismatch_rows = np.flatnonzero(mismatch.any(axis=1).to_numpy())
+            summary['total_rows'] += len(result_df)
+            summary['mismatch_rows'] += len(mismatch_rows)
+            counts = mismatch.sum()
+            summary['mismatch_counts'] = counts if summary['mismatch_counts'] is None \
+                else summary['mismatch_counts'] + counts
+            summary['df1_only_rows'] += len(df1_only)
+            summary['df2_only_rows'] += len(df2_only)
+
+            # 保留一部分不一致的行用于页面预览
+            keep = mismatch_rows[:PREVIEW_MISMATCH_ROWS - preview_rows]
+            if len(keep):
+                previews.append(result_df.iloc[keep])
+                preview_masks.append(mismatch.iloc[keep])
+                preview_rows += len(keep)
+
+        progress(1.0, "正在生成对比报告")
+        writer.close()
+
+    summary['preview'] = pd.concat(previews, ignore_index=True) if previews else None
+    summary['preview_mismatch'] = pd.concat(preview_masks, ignore_index=True) if preview_masks else None
+    return summary
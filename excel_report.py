@@ -0,0 +1,251 @@
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+from excel_diff import SUFFIXES
+
+# 每次生成 XML 的行数，控制写出时的内存占用
+WRITE_CHUNK_ROWS = 20000
+
+# 单个工作表最多的行数（含表头），超出后写入续表
+MAX_SHEET_ROWS = 1048576
+
+# Excel 日期序列号的起点
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+# styles.xml 中 cellXfs 的序号：普通、标红、日期、标红的日期
+STYLE_RED = 1
+STYLE_DATE = 2
+
+# 文本转义表：转义 XML 特殊字符，并去掉 XML 1.0 不允许出现的控制字符
+_XML_ESCAPE_TABLE = {ord('&'): '&amp;', ord('<'): '&lt;', ord('>'): '&gt;'}
+_XML_ESCAPE_TABLE.update({code: None for code in range(32) if code not in (9, 10, 13)})
+
+# 单元格的写出类型
+KIND_EMPTY, KIND_NUMBER, KIND_BOOL, KIND_DATE, KIND_TEXT = range(5)
+
+_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+_STYLES_XML = _XML_HEADER + f'''<styleSheet xmlns="{_MAIN_NS}">
+<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/><family val="2"/></font></fonts>
+<fills count="3"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFFF0000"/><bgColor indexed="64"/></patternFill></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="164" fontId="0" fillId="2" borderId="0" xfId="0" applyNumberFormat="1" applyFill="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+
+def _value_kind(value):
+    """object 列中单个值的写出类型"""
+    if value is None or value is pd.NaT or (isinstance(value, float) and value != value):
+        return KIND_EMPTY
+    if isinstance(value, (bool, np.bool_)):
+        return KIND_BOOL
+    if isinstance(value, int):
+        # 超出双精度能准确表示范围的整数（如 20 位发票号）按文本写出，避免丢失末尾数字
+        return KIND_NUMBER if abs(value) <= 2 ** 53 else KIND_TEXT
+    if isinstance(value, (float, np.integer, np.floating)):
+        return KIND_NUMBER if np.isfinite(value) else KIND_TEXT
+    if isinstance(value, (datetime, date, np.datetime64)):
+        return KIND_DATE
+    return KIND_TEXT
+
+
+def _value_kinds(values):
+    """批量判断一列中各值的写出类型"""
+    isna = values.isna().to_numpy()
+    if pd.api.types.is_bool_dtype(values):
+        return np.where(isna, KIND_EMPTY, KIND_BOOL)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return np.where(isna, KIND_EMPTY, KIND_DATE)
+    if pd.api.types.is_integer_dtype(values):
+        # 与 _value_kind 一致，超出双精度能准确表示范围的整数（如 19、20 位的单据号）按文本写出
+        numbers = values.to_numpy(dtype=f'{values.dtype.kind}8', na_value=0)
+        exact = (numbers >= -2 ** 53) & (numbers <= 2 ** 53)
+        return np.where(isna, KIND_EMPTY, np.where(exact, KIND_NUMBER, KIND_TEXT))
+    if pd.api.types.is_numeric_dtype(values):
+        finite = np.isfinite(values.to_numpy(dtype=float, na_value=np.nan))
+        return np.where(isna, KIND_EMPTY, np.where(finite, KIND_NUMBER, KIND_TEXT))
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        return np.where(isna, KIND_EMPTY, KIND_TEXT)
+    # 混合类型的 object 列逐个判断
+    return values.map(_value_kind).to_numpy(dtype=np.int8)
+
+
+def _text(values):
+    """转义文本，去掉 XML 不允许的字符"""
+    return values.astype(str).str.translate(_XML_ESCAPE_TABLE)
+
+
+def _excel_serial(values):
+    """把日期转换为 Excel 日期序列号"""
+    dates = pd.to_datetime(values)
+    if getattr(dates.dt, 'tz', None) is not None:
+        dates = dates.dt.tz_localize(None)
+    return ((dates - EXCEL_EPOCH) / pd.Timedelta(days=1)).astype(str)
+
+
+def _column_cells(values, refs, red):
+    """按列批量生成单元格 XML，空值返回空字符串"""
+    values = values.reset_index(drop=True)
+    cells = pd.Series('', index=values.index, dtype=object)
+    style = pd.Series('', index=values.index, dtype=object)
+    if red is not None:
+        style[red] = f' s="{STYLE_RED}"'
+
+    kinds = _value_kinds(values)
+    for kind in (KIND_NUMBER, KIND_BOOL, KIND_DATE, KIND_TEXT):
+        mask = kinds == kind
+        if not mask.any():
+            continue
+        subset = values[mask]
+        if kind == KIND_NUMBER:
+            cells[mask] = '<c r="' + refs[mask] + '"' + style[mask] + '><v>' + subset.astype(str) + '</v></c>'
+        elif kind == KIND_BOOL:
+            flags = np.where(subset.astype(bool), '1', '0')
+            cells[mask] = '<c r="' + refs[mask] + '"' + style[mask] + ' t="b"><v>' + flags + '</v></c>'
+        elif kind == KIND_DATE:
+            date_style = np.where(style[mask] == '', f' s="{STYLE_DATE}"', f' s="{STYLE_DATE + STYLE_RED}"')
+            cells[mask] = '<c r="' + refs[mask] + '"' + date_style + '><v>' + _excel_serial(subset).to_numpy() \
+                + '</v></c>'
+        else:
+            cells[mask] = '<c r="' + refs[mask] + '"' + style[mask] + ' t="inlineStr"><is><t xml:space="preserve">' \
+                + _text(subset) + '</t></is></c>'
+
+    # 标红的空单元格也需要写出样式
+    empty_red = (kinds == KIND_EMPTY) & (style != '').to_numpy()
+    if empty_red.any():
+        cells[empty_red] = '<c r="' + refs[empty_red] + '"' + style[empty_red] + '/>'
+    return cells.to_numpy()
+
+
+class ReportWriter:
+    """流式写出 Excel 报告
+
+    按列批量生成工作表 XML，再按块写入临时文件，内存占用只与每块的行数有关。
+    同一工作表可多次调用 write_frame 追加数据，close 时打包为 xlsx。
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self._sheets = {}
+        self._continued = {}
+
+    def _sheet(self, sheet_name, columns, rollover=False):
+        """返回工作表当前写入的部分，写满后 rollover 时另起续表"""
+        names = self._continued.setdefault(sheet_name, [])
+        if not names or (rollover and self._sheets[names[-1]][1] > MAX_SHEET_ROWS):
+            name = sheet_name if not names else f'{sheet_name}_{len(names) + 1}'
+            part = tempfile.TemporaryFile()
+            part.write(f'{_XML_HEADER}<worksheet xmlns="{_MAIN_NS}"><sheetData>'.encode('utf-8'))
+            header = pd.Series([str(col) for col in columns], dtype=object)
+            refs = pd.Series([f'{get_column_letter(i + 1)}1' for i in range(len(columns))], dtype=object)
+            part.write(('<row r="1">' + ''.join(_column_cells(header, refs, None)) + '</row>').encode('utf-8'))
+            self._sheets[name] = [part, 2]
+            names.append(name)
+        return self._sheets[names[-1]]
+
+    def write_frame(self, sheet_name, df, mismatch=None):
+        """把 DataFrame 追加写入工作表，mismatch 中为 True 的单元格标红
+
+        mismatch 为按对比列计算的不一致矩阵，标记 df 中对应的 _A 和 _B 两列。
+        超出 Excel 单表行数上限的部分写入名为 “工作表名_2” 等的续表。
+        """
+        # 把按对比列的不一致矩阵展开到报告的列位置
+        red_columns = {}
+        if mismatch is not None:
+            for col in mismatch.columns:
+                for suffix in SUFFIXES:
+                    red_columns[f'{col}{suffix}'] = mismatch[col].to_numpy()
+
+        letters = [get_column_letter(i + 1) for i in range(len(df.columns))]
+        start = 0
+        while True:
+            sheet = self._sheet(sheet_name, df.columns, rollover=start < len(df))
+            part, next_row = sheet
+            stop = min(len(df), start + WRITE_CHUNK_ROWS, start + MAX_SHEET_ROWS + 1 - next_row)
+            if stop <= start:
+                break
+            chunk = df.iloc[start:stop]
+            row_numbers = pd.Series(np.arange(next_row, next_row + len(chunk)).astype(str), dtype=object)
+            # 每行的 XML 由行标签和各列单元格拼接而成，按行展开后一次性 join
+            parts = np.empty((len(chunk), len(df.columns) + 2), dtype=object)
+            parts[:, 0] = ('<row r="' + row_numbers + '">').to_numpy()
+            for i, col in enumerate(df.columns):
+                red = red_columns[col][start:stop] if col in red_columns else None
+                parts[:, i + 1] = _column_cells(chunk.iloc[:, i], letters[i] + row_numbers, red)
+            parts[:, -1] = '</row>'
+            part.write(''.join(parts.ravel().tolist()).encode('utf-8'))
+            sheet[1] = next_row + len(chunk)
+            start = stop
+
+    def close(self):
+        """把各工作表打包为 xlsx 写入 output"""
+        names = list(self._sheets)
+        content_types = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(names) + 1))
+        sheets = ''.join(f'<sheet name={quoteattr(name)} sheetId="{i}" r:id="rId{i}"/>'
+                         for i, name in enumerate(names, start=1))
+        sheet_rels = ''.join(
+            f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, len(names) + 1))
+
+        with zipfile.ZipFile(self.output, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            archive.writestr('[Content_Types].xml', _XML_HEADER + (
+                '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                '<Default Extension="xml" ContentType="application/xml"/>'
+                '<Override PartName="/xl/workbook.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                '<Override PartName="/xl/styles.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                f'{content_types}</Types>'))
+            archive.writestr('_rels/.rels', _XML_HEADER + (
+                f'<Relationships xmlns="{_PKG_REL_NS}">'
+                f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+                '</Relationships>'))
+            archive.writestr('xl/workbook.xml', _XML_HEADER + (
+                f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>{sheets}</sheets></workbook>'))
+            archive.writestr('xl/_rels/workbook.xml.rels', _XML_HEADER + (
+                f'<Relationships xmlns="{_PKG_REL_NS}">{sheet_rels}'
+                f'<Relationship Id="rId{len(names) + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+                '</Relationships>'))
+            archive.writestr('xl/styles.xml', _STYLES_XML)
+            for i, name in enumerate(names, start=1):
+                part = self._sheets[name][0]
+                part.write(b'</sheetData></worksheet>')
+                part.seek(0)
+                with archive.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as target:
+                    shutil.copyfileobj(part, target)
+                part.close()
+        self._sheets = {}
+        self._continued = {}
+
+
+def write_compare_report(output, result_df, mismatch, df1_only, df2_only):
+    """写出 Excel 对比报告：共同数据（不一致单元格标红）和两个表格各自独有的数据"""
+    writer = ReportWriter(output)
+    writer.write_frame('对比结果', result_df, mismatch)
+    writer.write_frame('第一个表格独有的数据', df1_only)
+    writer.write_frame('第二个表格独有的数据', df2_only)
+    writer.close()
+    return output
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+# 发票号末尾参与连号计算的最多位数，超过的部分并入前缀，保证数值不超出 int64
+MAX_SUFFIX_DIGITS = 18
+
+
+def invoice_text(values):
+    """把发票号统一为去掉首尾空格的文本，Excel 中存为数字的发票号按整数转为文本，空值保持为空"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('Int64').astype(str).where(values.notna())
+    return values.astype(str).str.strip().where(values.notna())
+
+
+def invoice_keys(values):
+    """把整列发票号拆成 (前缀, 末尾数字)
+
+    前缀为文本，空值和不以数字结尾的发票号前缀为 None；末尾数字为 int64，
+    按数值计算，099 的下一张是 100，进位不影响判断。
+    """
+    text = invoice_text(values)
+    valid = text.notna().to_numpy()
+    text = text.fillna('')
+
+    # 只取末尾 MAX_SUFFIX_DIGITS + 1 个字符转为定长的字符码矩阵，按列做数值运算，不逐行解析
+    width = MAX_SUFFIX_DIGITS + 1
+    tails = np.array(text.str[-width:].to_numpy(dtype=object), dtype=f'<U{width}')
+    chars = tails.view(np.uint32).reshape(len(tails), width)
+    lengths = text.str.len().to_numpy(dtype=np.int64)
+    tail_lengths = np.minimum(lengths, width)
+    columns = np.arange(width)
+    digits = (chars >= ord('0')) & (chars <= ord('9'))
+
+    # 末尾连续数字的位数，超过 MAX_SUFFIX_DIGITS 的部分并入前缀
+    last_other = np.where(~digits & (columns < tail_lengths[:, None]), columns, -1).max(axis=1)
+    suffix_digits = np.minimum(tail_lengths - 1 - last_other, MAX_SUFFIX_DIGITS)
+    valid = valid & (suffix_digits > 0)
+
+    # 各位数字乘以对应的 10 的幂次求和
+    powers = tail_lengths[:, None] - 1 - columns
+    in_suffix = (powers >= 0) & (powers < suffix_digits[:, None])
+    place_values = 10 ** np.where(in_suffix, powers, 0).astype(np.int64)
+    numbers = (np.where(in_suffix, chars.astype(np.int64) - ord('0'), 0) * place_values).sum(axis=1)
+
+    # 前缀为去掉末尾数字后的文本，末尾数字的位数通常只有一两种，按位数分组截取
+    prefixes = pd.Series(None, index=text.index, dtype=object)
+    for count in np.unique(suffix_digits[valid]):
+        rows = valid & (suffix_digits == count)
+        prefixes[rows] = text[rows].str[:-int(count)].to_numpy(dtype=object)
+    return prefixes, numbers
+
+
+def split_invoice_numbers(values):
+    """把整列发票号拆成 (前缀编码, 末尾数字)，无法参与连号判断的发票号前缀编码为 -1"""
+    prefixes, numbers = invoice_keys(values)
+    prefix_codes, _ = pd.factorize(prefixes)
+    return prefix_codes, numbers
+
+
+# 连号组的列名
+RUN_ID = '连号组'
+RUN_LENGTH = '连号张数'
+RUN_START = '起始发票号'
+RUN_END = '结束发票号'
+RUN_ROWS = '行数'
+RUN_AMOUNT = '价税合计合计'
+RUN_SELLERS = '销售方数'
+
+
+def consecutive_runs(values):
+    """把存在连号的发票划分为连续的号码段，返回 (行位置, 各行的连号组编号)
+
+    发票号按 (前缀, 末尾数字) 排序后一次扫描：同一前缀下相差 1 的相邻号码属于同一组，
+    不足两个号码的组不是连号。行位置按发票号排序，连号组从 0 开始按排序先后编号，
+    重复的号码的各行属于同一组。总计 O(n log n)。
+    """
+    prefix_codes, numbers = split_invoice_numbers(values)
+    order = np.lexsort((numbers, prefix_codes))
+    order = order[prefix_codes[order] >= 0]
+    prefixes = prefix_codes[order]
+    numbers = numbers[order]
+
+    # 重复的号码合为一个，在不重复的号码上划分连号组
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (prefixes[1:] != prefixes[:-1]) | (numbers[1:] != numbers[:-1])
+    unique_prefixes = prefixes[first]
+    unique_numbers = numbers[first]
+    adjacent = (unique_prefixes[1:] == unique_prefixes[:-1]) & (np.diff(unique_numbers) == 1)
+    runs = np.zeros(len(unique_numbers), dtype=np.int64)
+    runs[1:] = np.cumsum(~adjacent)
+
+    # 只保留至少有两个号码的组，重新连续编号
+    in_run = (np.bincount(runs) > 1)[runs]
+    run_starts = np.ones(len(runs), dtype=bool)
+    run_starts[1:] = runs[1:] != runs[:-1]
+    run_ids = np.cumsum(run_starts & in_run) - 1
+    row_runs = np.cumsum(first) - 1
+    keep = in_run[row_runs]
+    return order[keep], run_ids[row_runs[keep]]
+
+
+def consecutive_order(values):
+    """返回存在相邻号码的发票的行位置，按发票号排序"""
+    return consecutive_runs(values)[0]
+
+
+def run_statistics(df, invoice_column, amount_column=None, seller_column=None):
+    """返回 (带连号组信息的连号发票行, 连号组汇总表)
+
+    各行增加连号组、连号张数、起始发票号和结束发票号列；汇总表每个连号组一行，包含张数、
+    行数、起止发票号，以及 df 中有金额列和销售方列时的价税合计合计和不同销售方的个数，
+    供按最长或金额最大的连号组排序。各项统计都由一次排序得到的分组编号按整数计数，不逐组循环。
+    """
+    positions, run_ids = consecutive_runs(df[invoice_column])
+    n_runs = int(run_ids.max()) + 1 if len(run_ids) else 0
+    rows = df.iloc[positions]
+    invoices = invoice_text(rows[invoice_column]).to_numpy(dtype=object)
+
+    # 组内张数按不重复的号码计，行按发票号排序，每组的首行和末行即起止号码
+    distinct = np.ones(len(invoices), dtype=bool)
+    distinct[1:] = (run_ids[1:] != run_ids[:-1]) | (invoices[1:] != invoices[:-1])
+    lengths = np.bincount(run_ids[distinct], minlength=n_runs)
+    row_counts = np.bincount(run_ids, minlength=n_runs)
+    ends = np.cumsum(row_counts)
+    starts = ends - row_counts
+
+    summary = pd.DataFrame({
+        RUN_ID: np.arange(1, n_runs + 1),
+        RUN_START: invoices[starts],
+        RUN_END: invoices[ends - 1],
+        RUN_LENGTH: lengths,
+        RUN_ROWS: row_counts,
+    })
+    if amount_column is not None and amount_column in df.columns:
+        amounts = pd.to_numeric(rows[amount_column], errors='coerce').fillna(0).to_numpy(dtype=float)
+        summary[RUN_AMOUNT] = np.bincount(run_ids, weights=amounts, minlength=n_runs)
+    if seller_column is not None and seller_column in df.columns:
+        # (连号组, 销售方) 组合去重后按组计数，空的销售方不计
+        seller_codes, sellers = pd.factorize(rows[seller_column])
+        named = seller_codes >= 0
+        pairs = np.unique(run_ids[named].astype(np.int64) * len(sellers) + seller_codes[named])
+        summary[RUN_SELLERS] = np.bincount(pairs // max(len(sellers), 1), minlength=n_runs)
+
+    rows = rows.assign(**{RUN_ID: run_ids + 1, RUN_LENGTH: lengths[run_ids], RUN_START: invoices[starts][run_ids],
+                          RUN_END: invoices[ends - 1][run_ids]})
+    return rows, summary
+
+
+def check_consecutive_invoices(df, invoice_column):
+    """返回存在连号的发票对应的行，按发票号排序"""
+    return df.iloc[consecutive_order(df[invoice_column])]
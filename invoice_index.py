@@ -0,0 +1,138 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from invoice_check import invoice_keys, invoice_text
+
+# 发票索引数据库的位置，多个会话和多次上传共用同一个索引
+INVOICE_INDEX_PATH = os.environ.get(
+    'INVOICE_INDEX_PATH', os.path.join(os.path.expanduser('~'), '.streamlit_play', 'invoice_index.sqlite3'))
+
+# 跨文件匹配结果的列名
+ROW = '行号'
+INVOICE = '发票号码'
+AMOUNT = '金额'
+SELLER = '销售方'
+OTHER_INVOICE = '其他文件中的发票号码'
+OTHER_AMOUNT = '其他文件中的金额'
+OTHER_SELLER = '其他文件中的销售方'
+OTHER_FILE = '所在文件'
+OTHER_ROW = '所在行号'
+RELATION = '关系'
+
+# 关系列的取值
+DUPLICATE = '重复'
+CONSECUTIVE = '连号'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    indexed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invoices (
+    file_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    invoice TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    amount REAL,
+    seller TEXT
+);
+CREATE INDEX IF NOT EXISTS invoices_number ON invoices (prefix, number);
+CREATE INDEX IF NOT EXISTS invoices_file ON invoices (file_id);
+'''
+
+
+class InvoiceIndex:
+    """保存在本地 SQLite 中的发票索引，用于跨文件检查重复报销和连号
+
+    每个上传的文件按内容哈希只追加一次，发票号按 (前缀, 末尾数字) 建立 B 树索引，
+    查找相同或相邻的号码时每张发票只需一次对数复杂度的索引查找，与索引中的发票总数基本无关。
+    """
+
+    def __init__(self, path=INVOICE_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # Streamlit 的各会话运行在不同线程中，每次操作单独打开连接
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def __contains__(self, digest):
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT 1 FROM files WHERE digest = ?', (digest,)).fetchone() is not None
+
+    def file_count(self):
+        """已索引的文件数"""
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def add_file(self, digest, name, df, invoice_column, amount_column=None, seller_column=None):
+        """把文件中的发票追加到索引，内容相同的文件已索引时不做任何操作，返回是否新增
+
+        行号为发票在 df 中的位置，无法参与连号判断的发票号不写入索引。
+        """
+        if digest in self:
+            return False
+        prefixes, numbers = invoice_keys(df[invoice_column])
+        prefixes = prefixes.to_numpy(dtype=object)
+        rows = np.flatnonzero(pd.notna(prefixes))
+        # 按 (前缀, 末尾数字) 的顺序写入，索引的 B 树按顺序追加，比随机插入快得多
+        rows = rows[np.lexsort((numbers[rows], prefixes[rows].astype(str)))]
+        amounts = sellers = [None] * len(rows)
+        if amount_column is not None and amount_column in df.columns:
+            amounts = pd.to_numeric(df[amount_column], errors='coerce').to_numpy(dtype=float)[rows]
+            amounts = np.where(np.isnan(amounts), None, amounts).tolist()
+        if seller_column is not None and seller_column in df.columns:
+            sellers = df[seller_column].astype(object).where(df[seller_column].notna(), None).to_numpy()[rows].tolist()
+        records = zip(rows.tolist(), invoice_text(df[invoice_column]).to_numpy(dtype=object)[rows].tolist(),
+                      prefixes[rows].tolist(), numbers[rows].tolist(), amounts, sellers)
+
+        with closing(self._connect()) as conn:
+            try:
+                with conn:
+                    # 文件记录和发票在同一个事务中写入，digest 唯一保证同一文件并发上传时只写入一次
+                    file_id = conn.execute(
+                        'INSERT INTO files (digest, name, rows, indexed_at) VALUES (?, ?, ?, ?)',
+                        (digest, name, len(df), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+                    conn.executemany(
+                        'INSERT INTO invoices (file_id, row, invoice, prefix, number, amount, seller) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        ((file_id, *record) for record in records))
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def cross_file_matches(self, digest):
+        """返回该文件中与其他已索引文件的发票重复或连号的发票
+
+        对文件中的每张发票，按 (前缀, 末尾数字 - 1 到 + 1) 在索引上做范围查找，
+        末尾数字相同为重复，相差 1 为连号。结果附带两边的金额和销售方，便于判断是否重复报销，按行号排序。
+        """
+        query = '''
+            SELECT a.row, a.invoice, a.amount, a.seller, b.invoice, b.amount, b.seller, f.name, b.row,
+                   b.number - a.number
+            FROM invoices AS a
+            JOIN invoices AS b INDEXED BY invoices_number
+              ON b.prefix = a.prefix AND b.number BETWEEN a.number - 1 AND a.number + 1
+            JOIN files AS f ON f.id = b.file_id
+            WHERE a.file_id = (SELECT id FROM files WHERE digest = ?) AND b.file_id != a.file_id
+            ORDER BY a.row, b.file_id, b.row
+        '''
+        with closing(self._connect()) as conn:
+            matches = pd.DataFrame(conn.execute(query, (digest,)).fetchall(),
+                                   columns=[ROW, INVOICE, AMOUNT, SELLER, OTHER_INVOICE, OTHER_AMOUNT,
+                                            OTHER_SELLER, OTHER_FILE, OTHER_ROW, RELATION])
+        matches[RELATION] = np.where(matches[RELATION].to_numpy() == 0, DUPLICATE, CONSECUTIVE)
+        return matches
@@ -3,6 +3,12 @@ import pandas as pd
 from datetime import datetime
 from io import BytesIO
 
+from bom_diff import compare_bom_trees, compare_boms, join_positions, merge_sizes
+from excel_loader import load_compact_excel
+from table_view import searchable_dataframe
+
+# 层级列选项中表示按单层 BOM 对比的一项
+NO_LEVEL = "（无，按单层 BOM 对比）"
 
 # 设置页面标题和布局
 st.set_page_config(page_title="BOM 比对页面", layout="wide")
@@ -24,9 +30,12 @@ with st.sidebar:
 
     if original_bom_file and new_bom_file:
         try:
-            st.session_state.original_bom = pd.read_excel(original_bom_file)
-            st.session_state.new_bom = pd.read_excel(new_bom_file)
+            # 加载时压缩列类型，低基数的文本列转为分类类型
+            st.session_state.original_bom, *original_memory = load_compact_excel(original_bom_file)
+            st.session_state.new_bom, *new_memory = load_compact_excel(new_bom_file)
             st.success("文件读取成功！")
+            st.caption("内存占用：原版本 {:.1f} MB → {:.1f} MB，新版本 {:.1f} MB → {:.1f} MB".format(
+                *(size / 2 ** 20 for size in original_memory + new_memory)))
         except Exception as e:
             st.error(f"读取文件时出现错误: {e}")
 
@@ -40,23 +49,44 @@ if st.session_state.original_bom is not None and st.session_state.new_bom is not
     material_code_column = st.selectbox("物料编码列", common_columns,
                                         index=common_columns.index(default_material))
 
+    # 物料编码重复时，提示直接按物料编码关联会膨胀到的行数
+    if material_code_column in st.session_state.new_bom.columns:
+        direct_rows, keyed_rows = merge_sizes(st.session_state.original_bom, st.session_state.new_bom,
+                                              material_code_column)
+        if direct_rows > keyed_rows:
+            st.warning(f"物料编码存在重复：直接按物料编码关联将产生 {direct_rows} 行。比对时位置号按物料合并后对比，"
+                       f"其他列按物料编码和行序号逐行对应，共 {keyed_rows} 行。")
+
     # 位置号列选择
     position_columns = [col for col in common_columns if col != material_code_column]
     default_position = next((col for col in position_columns if "位置号" in col), position_columns[0])
     position_number_column = st.selectbox("位置号列", position_columns,
                                           index=position_columns.index(default_position))
 
+    # 层级列选择，选择后按多层 BOM 的父子结构对比
+    level_options = [NO_LEVEL] + [col for col in common_columns if col not in [material_code_column,
+                                                                            position_number_column]]
+    default_level = next((col for col in level_options if "层级" in col), NO_LEVEL)
+    level_column = st.selectbox("层级列（多层 BOM）", level_options, index=level_options.index(default_level))
+    level_column = None if level_column == NO_LEVEL else level_column
+
     # 其他列选择
-    other_columns = [col for col in common_columns if col not in [material_code_column, position_number_column]]
+    other_columns = [col for col in common_columns if col not in [material_code_column, position_number_column,
+                                                                  level_column]]
     selected_other_columns = st.multiselect("选择其他列（可多选）", other_columns)
 
     # 保存选择状态到会话状态
     st.session_state.selected_columns = {
         "material": material_code_column,
         "position": position_number_column,
-        "others": selected_other_columns
+        "others": selected_other_columns,
+        "level": level_column
     }
 
+    # 文件或比对参数变化后，之前的比对结果不再显示
+    bom_inputs = (getattr(original_bom_file, 'file_id', None), getattr(new_bom_file, 'file_id', None),
+                  material_code_column, position_number_column, level_column, tuple(selected_other_columns))
+
     # 开始比对按钮
     if st.button("开始比对"):
         if not material_code_column or not position_number_column:
@@ -65,91 +95,67 @@ if st.session_state.original_bom is not None and st.session_state.new_bom is not
             comparison_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
 
-            # 1. 对比两个文件的物料编码
-            original_material_codes = set(st.session_state.original_bom[material_code_column])
-            new_material_codes = set(st.session_state.new_bom[material_code_column])
-            old_diff_codes = original_material_codes - new_material_codes
-            new_diff_codes = new_material_codes - original_material_codes
-
-            material_diff_report = []
-            if not old_diff_codes and not new_diff_codes:
-                material_diff_report.append("物料编码没问题。")
+            # 对比逻辑在 bom_diff 中，页面只负责展示
+            if level_column:
+                # 多层 BOM 按父子结构逐层对比，没有变化的子树直接跳过
+                try:
+                    result = compare_bom_trees(st.session_state.original_bom, st.session_state.new_bom,
+                                               material_code_column, level_column, position_number_column,
+                                               selected_other_columns)
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+                report = {
+                    "removed_nodes": result['removed_nodes'],
+                    "added_nodes": result['added_nodes'],
+                    "attribute_diffs": result['attribute_diffs'],
+                    "visited_nodes": result['visited_nodes'],
+                }
+                sheets = {
+                    '结构差异_旧版本有': result['removed_nodes'],
+                    '结构差异_新版本有': result['added_nodes'],
+                    '属性差异': result['attribute_diffs'],
+                }
             else:
-                if old_diff_codes:
-                    material_diff_report.append(
-                        f"旧版本中存在但新版本中不存在的物料编码: {', '.join(map(str, old_diff_codes))}")
-                if new_diff_codes:
-                    material_diff_report.append(
-                        f"新版本中存在但旧版本中不存在的物料编码: {', '.join(map(str, new_diff_codes))}")
-
-            # 2. 对比相同物料编码的位置号
-            merged = pd.merge(st.session_state.original_bom, st.session_state.new_bom, on=material_code_column,
-                              suffixes=('_old', '_new'))
-            position_diff_new_report = []
-            position_diff_old_report = []
-            for index, row in merged.iterrows():
-                old_positions_str = row[position_number_column + '_old']
-                new_positions_str = row[position_number_column + '_new']
-
-                # 处理空值和不规范的位置号
-                old_positions = set()
-                new_positions = set()
-
-                if isinstance(old_positions_str, str) and old_positions_str:
-                    # 替换全角逗号并去除前后空格
-                    old_positions = {pos.strip() for pos in old_positions_str.replace('，', ',').split(',') if
-                                     pos.strip()}
-                if isinstance(new_positions_str, str) and new_positions_str:
-                    # 替换全角逗号并去除前后空格
-                    new_positions = {pos.strip() for pos in new_positions_str.replace('，', ',').split(',') if
-                                     pos.strip()}
-
-                new_only_positions = new_positions - old_positions
-                old_only_positions = old_positions - new_positions
-
-                if new_only_positions:
-                    position_diff_new_report.append(
-                        f"物料编码 {row[material_code_column]}: {', '.join(new_only_positions)}")
-                if old_only_positions:
-                    position_diff_old_report.append(
-                        f"物料编码 {row[material_code_column]}: {', '.join(old_only_positions)}")
-
-            # 3. 对比其他列
-            other_diff_report = []
-            if selected_other_columns:
-                for col in selected_other_columns:
-                    for index, row in merged.iterrows():
-                        old_value = row[col + '_old']
-                        new_value = row[col + '_new']
-                        # 检查是否两个值都是 NaN
-                        if pd.isna(old_value) and pd.isna(new_value):
-                            continue
-                        if old_value != new_value:
-                            other_diff_report.append(
-                                f"物料编码 {row[material_code_column]} 的 {col} 列存在差异，旧版本值: {old_value}，新版本值: {new_value}")
-
-            # 差异比对报告章节
-            st.markdown("<h2 style='color: #007BFF;'>差异比对报告</h2>", unsafe_allow_html=True)
-
-            # 用料差异
-            st.markdown("<h3 style='color: #28a745;'>用料差异</h3>", unsafe_allow_html=True)
-            for report in material_diff_report:
-                st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
-
-            # 位置号差异
-            st.markdown("<h3 style='color: #ffc107;'>位置号差异</h3>", unsafe_allow_html=True)
-            st.markdown("<h4 style='color: #ffc107;'>新版本有而旧版本没有的位置号</h4>", unsafe_allow_html=True)
-            for report in position_diff_new_report:
-                st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
-            st.markdown("<h4 style='color: #ffc107;'>旧版本有而新版本没有的位置号</h4>", unsafe_allow_html=True)
-            for report in position_diff_old_report:
-                st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
-
-            # 其他选择列的差异
-            if selected_other_columns:
-                st.markdown("<h3 style='color: #dc3545;'>其他选择列的差异</h3>", unsafe_allow_html=True)
-                for report in other_diff_report:
-                    st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
+                result = compare_boms(st.session_state.original_bom, st.session_state.new_bom, material_code_column,
+                                      position_number_column, selected_other_columns)
+
+                # 1. 物料编码差异，两个方向合成一张表
+                material_diffs = pd.concat([
+                    pd.DataFrame({material_code_column: result['removed_materials'], "差异": "旧版本有而新版本没有"}),
+                    pd.DataFrame({material_code_column: result['added_materials'], "差异": "新版本有而旧版本没有"}),
+                ], ignore_index=True)
+
+                # 重复物料在一个版本中多出的行，两个方向合成一张表
+                line_diffs = pd.concat([
+                    result['removed_lines'].assign(**{"差异": "旧版本多出的行"}),
+                    result['added_lines'].assign(**{"差异": "新版本多出的行"}),
+                ], ignore_index=True)
+
+                # 2. 相同物料编码的位置号差异，每个物料一行
+                positions_added = join_positions(result['positions_added'], material_code_column)
+                positions_removed = join_positions(result['positions_removed'], material_code_column)
+
+                # 3. 其他列的差异
+                # (物料编码, 列名, 旧版本值, 新版本值) 长表，页面和 Excel 报告直接使用
+                other_diffs = result['other_diffs']
+
+                report = {
+                    "material_diffs": material_diffs,
+                    "line_diffs": line_diffs,
+                    "positions_added": positions_added,
+                    "positions_removed": positions_removed,
+                    "position_counts": (len(result['positions_added']), len(result['positions_removed'])),
+                    "other_diffs": other_diffs,
+                }
+                sheets = {
+                    '用料差异': material_diffs,
+                    '重复物料行数差异': line_diffs,
+                    '位置号差异_新版本有': positions_added,
+                    '位置号差异_旧版本有': positions_removed,
+                }
+                if selected_other_columns:
+                    sheets['其他选择列差异'] = other_diffs
 
             # 生成 Excel 报告
             output = BytesIO()
@@ -162,37 +168,82 @@ if st.session_state.original_bom is not None and st.session_state.new_bom is not
                     f"物料编码列: {material_code_column}",
                     f"位置号列: {position_number_column}"
                 ]
+                if level_column:
+                    summary_info.append(f"层级列: {level_column}")
                 if selected_other_columns:
                     summary_info.append(f"其他列: {', '.join(selected_other_columns)}")
                 summary_df = pd.DataFrame({"比对信息": summary_info})
                 summary_df.to_excel(writer, sheet_name='汇总信息', index=False)
 
-                # 用料差异工作表
-                material_diff_df = pd.DataFrame({"用料差异": material_diff_report})
-                material_diff_df.to_excel(writer, sheet_name='用料差异', index=False)
-
-                # 位置号差异工作表 - 新版本有旧版本没有
-                position_diff_new_df = pd.DataFrame({"新版本有而旧版本没有的位置号差异": position_diff_new_report})
-                position_diff_new_df.to_excel(writer, sheet_name='位置号差异_新版本有', index=False)
+                # 各差异工作表
+                for sheet_name, table in sheets.items():
+                    table.to_excel(writer, sheet_name=sheet_name, index=False)
+
+            # 翻页和搜索会重新运行页面，比对结果保存在会话状态中
+            report.update({"inputs": bom_inputs, "excel_bytes": output.getvalue(), "timestamp": timestamp})
+            st.session_state.bom_report = report
+
+    bom_report = st.session_state.get('bom_report')
+    if bom_report is not None and bom_report["inputs"] == bom_inputs:
+        # 差异比对报告章节，各部分为分页的表格，每次只渲染一页
+        st.markdown("<h2 style='color: #007BFF;'>差异比对报告</h2>", unsafe_allow_html=True)
+
+        if level_column:
+            # 结构差异，新增或删除的整棵子树只列出最上面的一行
+            st.caption(f"逐层展开对比了 {bom_report['visited_nodes']} 对节点，其余子树没有变化。")
+            st.markdown("<h3 style='color: #28a745;'>结构差异</h3>", unsafe_allow_html=True)
+            st.markdown(f"<h4 style='color: #28a745;'>旧版本有而新版本没有的节点（{len(bom_report['removed_nodes'])} "
+                        f"个）</h4>", unsafe_allow_html=True)
+            searchable_dataframe(bom_report["removed_nodes"], 'bom_removed_nodes')
+            st.markdown(f"<h4 style='color: #28a745;'>新版本有而旧版本没有的节点（{len(bom_report['added_nodes'])} "
+                        f"个）</h4>", unsafe_allow_html=True)
+            searchable_dataframe(bom_report["added_nodes"], 'bom_added_nodes')
+
+            # 相同路径的节点的位置号和其他选择列的差异
+            st.markdown(f"<h3 style='color: #dc3545;'>属性差异（{len(bom_report['attribute_diffs'])} 处）</h3>",
+                        unsafe_allow_html=True)
+            searchable_dataframe(bom_report["attribute_diffs"], 'bom_attribute_diffs')
+        else:
+            # 用料差异
+            material_diffs = bom_report["material_diffs"]
+            st.markdown(f"<h3 style='color: #28a745;'>用料差异（{len(material_diffs)} 个物料编码）</h3>",
+                        unsafe_allow_html=True)
+            if material_diffs.empty:
+                st.markdown("<p style='color: #6c757d;'>物料编码没问题。</p>", unsafe_allow_html=True)
+            else:
+                searchable_dataframe(material_diffs, 'bom_material_diffs')
+
+            # 重复物料多出的行
+            line_diffs = bom_report["line_diffs"]
+            st.markdown(f"<h3 style='color: #28a745;'>重复物料的行数差异（{len(line_diffs)} 行）</h3>",
+                        unsafe_allow_html=True)
+            if line_diffs.empty:
+                st.markdown("<p style='color: #6c757d;'>重复物料的行数一致。</p>", unsafe_allow_html=True)
+            else:
+                searchable_dataframe(line_diffs, 'bom_line_diffs')
 
-                # 位置号差异工作表 - 旧版本有新版本没有
-                position_diff_old_df = pd.DataFrame({"旧版本有而新版本没有的位置号差异": position_diff_old_report})
-                position_diff_old_df.to_excel(writer, sheet_name='位置号差异_旧版本有', index=False)
+            # 位置号差异
+            added_count, removed_count = bom_report["position_counts"]
+            st.markdown("<h3 style='color: #ffc107;'>位置号差异</h3>", unsafe_allow_html=True)
+            st.markdown(f"<h4 style='color: #ffc107;'>新版本有而旧版本没有的位置号（{added_count} 个位置号，"
+                        f"涉及 {len(bom_report['positions_added'])} 个物料）</h4>", unsafe_allow_html=True)
+            searchable_dataframe(bom_report["positions_added"], 'bom_positions_added')
+            st.markdown(f"<h4 style='color: #ffc107;'>旧版本有而新版本没有的位置号（{removed_count} 个位置号，"
+                        f"涉及 {len(bom_report['positions_removed'])} 个物料）</h4>", unsafe_allow_html=True)
+            searchable_dataframe(bom_report["positions_removed"], 'bom_positions_removed')
 
-                # 其他选择列的差异工作表
-                if selected_other_columns:
-                    other_diff_df = pd.DataFrame({"其他选择列的差异": other_diff_report})
-                    other_diff_df.to_excel(writer, sheet_name='其他选择列差异', index=False)
-
-            # 获取二进制数据
-            excel_bytes = output.getvalue()
-
-            # 下载报告按钮
-            st.download_button(
-                label="下载差异比对报告（Excel 格式）",
-                data=excel_bytes,
-                file_name=f"BOM_Comparison_Report_{timestamp}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            # 其他选择列的差异
+            if selected_other_columns:
+                st.markdown(f"<h3 style='color: #dc3545;'>其他选择列的差异（{len(bom_report['other_diffs'])} 处）</h3>",
+                            unsafe_allow_html=True)
+                searchable_dataframe(bom_report["other_diffs"], 'bom_other_diffs')
+
+        # 下载报告按钮
+        st.download_button(
+            label="下载差异比对报告（Excel 格式）",
+            data=bom_report["excel_bytes"],
+            file_name=f"BOM_Comparison_Report_{bom_report['timestamp']}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
 else:
     st.info("请在侧边栏上传原版本 BOM 文件和新版本 BOM 文件。")
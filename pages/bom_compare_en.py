@@ -3,6 +3,13 @@ import pandas as pd
 from datetime import datetime
 from io import BytesIO
 
+from bom_diff import (COLUMN, LEVEL, LINE, NEW_VALUE, OLD_VALUE, PATH, POSITION, SUBTREE_ROWS, compare_bom_trees,
+                      compare_boms, join_positions, merge_sizes)
+from excel_loader import load_compact_excel
+from table_view import searchable_dataframe
+
+# Level column option meaning a flat, single-level comparison
+NO_LEVEL = "(None, compare as a single-level BOM)"
 
 # Set page title and layout
 st.set_page_config(page_title="BOM Comparison Page", layout="wide")
@@ -24,9 +31,12 @@ with st.sidebar:
 
     if original_bom_file and new_bom_file:
         try:
-            st.session_state.original_bom = pd.read_excel(original_bom_file)
-            st.session_state.new_bom = pd.read_excel(new_bom_file)
+            # Compact column types on load: low-cardinality text columns become categoricals
+            st.session_state.original_bom, *original_memory = load_compact_excel(original_bom_file)
+            st.session_state.new_bom, *new_memory = load_compact_excel(new_bom_file)
             st.success("Files read successfully!")
+            st.caption("Memory: original {:.1f} MB → {:.1f} MB, new {:.1f} MB → {:.1f} MB".format(
+                *(size / 2 ** 20 for size in original_memory + new_memory)))
         except Exception as e:
             st.error(f"An error occurred while reading the files: {e}")
 
@@ -48,6 +58,15 @@ if st.session_state.original_bom is not None and st.session_state.new_bom is not
     material_code_column = st.selectbox("Material Code Column", common_columns,
                                         index=common_columns.index(default_material))
 
+    # Warn about how far a plain merge on duplicated material codes would blow up
+    if material_code_column in st.session_state.new_bom.columns:
+        direct_rows, keyed_rows = merge_sizes(st.session_state.original_bom, st.session_state.new_bom,
+                                              material_code_column)
+        if direct_rows > keyed_rows:
+            st.warning(f"Duplicate material codes found: a plain merge on the material code would produce "
+                       f"{direct_rows} rows. Positions are unioned per material, and other columns are matched "
+                       f"line by line on material code and line number ({keyed_rows} rows).")
+
     # Position number column selection
     position_columns = [col for col in common_columns if col != material_code_column]
     default_position_keywords = ["position"]
@@ -55,17 +74,31 @@ if st.session_state.original_bom is not None and st.session_state.new_bom is not
     position_number_column = st.selectbox("Position Number Column", position_columns,
                                           index=position_columns.index(default_position))
 
+    # Level column selection; when chosen, the BOMs are compared along their parent/child structure
+    level_options = [NO_LEVEL] + [col for col in common_columns if col not in [material_code_column,
+                                                                            position_number_column]]
+    default_level = next((col for col in level_options[1:] if "level" in col.lower()), NO_LEVEL)
+    level_column = st.selectbox("Level Column (multi-level BOM)", level_options,
+                                index=level_options.index(default_level))
+    level_column = None if level_column == NO_LEVEL else level_column
+
     # Other column selection
-    other_columns = [col for col in common_columns if col not in [material_code_column, position_number_column]]
+    other_columns = [col for col in common_columns if col not in [material_code_column, position_number_column,
+                                                                  level_column]]
     selected_other_columns = st.multiselect("Select other columns (multiple selection allowed)", other_columns)
 
     # Save selection state to session state
     st.session_state.selected_columns = {
         "material": material_code_column,
         "position": position_number_column,
-        "others": selected_other_columns
+        "others": selected_other_columns,
+        "level": level_column
     }
 
+    # Results from earlier runs are only shown while the files and options stay the same
+    bom_inputs = (getattr(original_bom_file, 'file_id', None), getattr(new_bom_file, 'file_id', None),
+                  material_code_column, position_number_column, level_column, tuple(selected_other_columns))
+
     # Start comparison button
     if st.button("Start Comparison"):
         if not material_code_column or not position_number_column:
@@ -74,91 +107,77 @@ if st.session_state.original_bom is not None and st.session_state.new_bom is not
             comparison_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
 
-            # 1. Compare material codes in two files
-            original_material_codes = set(st.session_state.original_bom[material_code_column])
-            new_material_codes = set(st.session_state.new_bom[material_code_column])
-            old_diff_codes = original_material_codes - new_material_codes
-            new_diff_codes = new_material_codes - original_material_codes
-
-            material_diff_report = []
-            if not old_diff_codes and not new_diff_codes:
-                material_diff_report.append("Material codes are okay.")
+            # The diff itself lives in bom_diff; this page only renders it
+            if level_column:
+                # Multi-level BOMs are compared level by level along the tree, unchanged subtrees are skipped
+                try:
+                    result = compare_bom_trees(st.session_state.original_bom, st.session_state.new_bom,
+                                               material_code_column, level_column, position_number_column,
+                                               selected_other_columns)
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+                node_columns = {PATH: "Path", LEVEL: "Level", SUBTREE_ROWS: "Subtree Rows"}
+                removed_nodes = result['removed_nodes'].rename(columns=node_columns)
+                added_nodes = result['added_nodes'].rename(columns=node_columns)
+                attribute_diffs = result['attribute_diffs'].rename(
+                    columns={PATH: "Path", COLUMN: "Column", OLD_VALUE: "Old Value", NEW_VALUE: "New Value"})
+                report = {
+                    "removed_nodes": removed_nodes,
+                    "added_nodes": added_nodes,
+                    "attribute_diffs": attribute_diffs,
+                    "visited_nodes": result['visited_nodes'],
+                }
+                sheets = {
+                    'Tree Diff - Old': removed_nodes,
+                    'Tree Diff - New': added_nodes,
+                    'Attribute Diff': attribute_diffs,
+                }
             else:
-                if old_diff_codes:
-                    material_diff_report.append(
-                        f"Material codes present in the old version but not in the new version: {', '.join(map(str, old_diff_codes))}")
-                if new_diff_codes:
-                    material_diff_report.append(
-                        f"Material codes present in the new version but not in the old version: {', '.join(map(str, new_diff_codes))}")
-
-            # 2. Compare position numbers of the same material codes
-            merged = pd.merge(st.session_state.original_bom, st.session_state.new_bom, on=material_code_column,
-                              suffixes=('_old', '_new'))
-            position_diff_new_report = []
-            position_diff_old_report = []
-            for index, row in merged.iterrows():
-                old_positions_str = row[position_number_column + '_old']
-                new_positions_str = row[position_number_column + '_new']
-
-                # Handle null values and irregular position numbers
-                old_positions = set()
-                new_positions = set()
-
-                if isinstance(old_positions_str, str) and old_positions_str:
-                    # Replace full-width commas and remove leading and trailing spaces
-                    old_positions = {pos.strip() for pos in old_positions_str.replace('，', ',').split(',') if
-                                     pos.strip()}
-                if isinstance(new_positions_str, str) and new_positions_str:
-                    # Replace full-width commas and remove leading and trailing spaces
-                    new_positions = {pos.strip() for pos in new_positions_str.replace('，', ',').split(',') if
-                                     pos.strip()}
-
-                new_only_positions = new_positions - old_positions
-                old_only_positions = old_positions - new_positions
-
-                if new_only_positions:
-                    position_diff_new_report.append(
-                        f"Material code {row[material_code_column]}: {', '.join(new_only_positions)}")
-                if old_only_positions:
-                    position_diff_old_report.append(
-                        f"Material code {row[material_code_column]}: {', '.join(old_only_positions)}")
-
-            # 3. Compare other columns
-            other_diff_report = []
-            if selected_other_columns:
-                for col in selected_other_columns:
-                    for index, row in merged.iterrows():
-                        old_value = row[col + '_old']
-                        new_value = row[col + '_new']
-                        # Check if both values are NaN
-                        if pd.isna(old_value) and pd.isna(new_value):
-                            continue
-                        if old_value != new_value:
-                            other_diff_report.append(
-                                f"Column {col} of material code {row[material_code_column]} has differences. Old value: {old_value}, New value: {new_value}")
-
-            # Difference comparison report section
-            st.markdown("<h2 style='color: #007BFF;'>Difference Comparison Report</h2>", unsafe_allow_html=True)
+                result = compare_boms(st.session_state.original_bom, st.session_state.new_bom, material_code_column,
+                                      position_number_column, selected_other_columns)
 
-            # Material usage differences
-            st.markdown("<h3 style='color: #28a745;'>Material Usage Differences</h3>", unsafe_allow_html=True)
-            for report in material_diff_report:
-                st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
+                # 1. Material code differences in both directions, as one table
+                material_diffs = pd.concat([
+                    pd.DataFrame({material_code_column: result['removed_materials'],
+                                  "Difference": "In old version only"}),
+                    pd.DataFrame({material_code_column: result['added_materials'],
+                                  "Difference": "In new version only"}),
+                ], ignore_index=True)
 
-            # Position number differences
-            st.markdown("<h3 style='color: #ffc107;'>Position Number Differences</h3>", unsafe_allow_html=True)
-            st.markdown("<h4 style='color: #ffc107;'>Position numbers present in the new version but not in the old version</h4>", unsafe_allow_html=True)
-            for report in position_diff_new_report:
-                st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
-            st.markdown("<h4 style='color: #ffc107;'>Position numbers present in the old version but not in the new version</h4>", unsafe_allow_html=True)
-            for report in position_diff_old_report:
-                st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
+                # Extra lines of duplicated materials in either version, as one table
+                line_diffs = pd.concat([
+                    result['removed_lines'].assign(Difference="Extra line in old version"),
+                    result['added_lines'].assign(Difference="Extra line in new version"),
+                ], ignore_index=True).rename(columns={LINE: "Line"})
 
-            # Differences in other selected columns
-            if selected_other_columns:
-                st.markdown("<h3 style='color: #dc3545;'>Differences in Other Selected Columns</h3>", unsafe_allow_html=True)
-                for report in other_diff_report:
-                    st.markdown(f"<p style='color: #6c757d;'>{report}</p>", unsafe_allow_html=True)
+                # 2. Position number differences of the same material codes, one row per material
+                positions_added = join_positions(result['positions_added'], material_code_column).rename(
+                    columns={POSITION: "Positions"})
+                positions_removed = join_positions(result['positions_removed'], material_code_column).rename(
+                    columns={POSITION: "Positions"})
+
+                # 3. Differences in other columns
+                # (material code, column, old value, new value) table, used directly by the page and the Excel report
+                other_diffs = result['other_diffs'].rename(
+                    columns={LINE: "Line", COLUMN: "Column", OLD_VALUE: "Old Value", NEW_VALUE: "New Value"})
+
+                report = {
+                    "material_diffs": material_diffs,
+                    "line_diffs": line_diffs,
+                    "positions_added": positions_added,
+                    "positions_removed": positions_removed,
+                    "position_counts": (len(result['positions_added']), len(result['positions_removed'])),
+                    "other_diffs": other_diffs,
+                }
+                sheets = {
+                    'Material Diff': material_diffs,
+                    'Line Diff': line_diffs,
+                    'Pos Diff - New': positions_added,
+                    'Pos Diff - Old': positions_removed,
+                }
+                if selected_other_columns:
+                    sheets['Other Diff'] = other_diffs
 
             # Generate Excel report
             output = BytesIO()
@@ -171,37 +190,86 @@ if st.session_state.original_bom is not None and st.session_state.new_bom is not
                     f"Material code column: {material_code_column}",
                     f"Position number column: {position_number_column}"
                 ]
+                if level_column:
+                    summary_info.append(f"Level column: {level_column}")
                 if selected_other_columns:
                     summary_info.append(f"Other columns: {', '.join(selected_other_columns)}")
                 summary_df = pd.DataFrame({"Comparison Information": summary_info})
                 summary_df.to_excel(writer, sheet_name='Summary', index=False)
 
-                # Material usage differences worksheet
-                material_diff_df = pd.DataFrame({"Material Usage Differences": material_diff_report})
-                material_diff_df.to_excel(writer, sheet_name='Material Diff', index=False)
+                # Difference worksheets
+                for sheet_name, table in sheets.items():
+                    table.to_excel(writer, sheet_name=sheet_name, index=False)
 
-                # Position number differences worksheet - New version has but old version doesn't
-                position_diff_new_df = pd.DataFrame({"Position Numbers in New Version but not in Old Version": position_diff_new_report})
-                position_diff_new_df.to_excel(writer, sheet_name='Pos Diff - New', index=False)
+            # Paging and searching rerun the page, so the results are kept in session state
+            report.update({"inputs": bom_inputs, "excel_bytes": output.getvalue(), "timestamp": timestamp})
+            st.session_state.bom_report_en = report
 
-                # Position number differences worksheet - Old version has but new version doesn't
-                position_diff_old_df = pd.DataFrame({"Position Numbers in Old Version but not in New Version": position_diff_old_report})
-                position_diff_old_df.to_excel(writer, sheet_name='Pos Diff - Old', index=False)
+    bom_report = st.session_state.get('bom_report_en')
+    if bom_report is not None and bom_report["inputs"] == bom_inputs:
+        # Difference comparison report section; each part is a paged table and only one page is rendered
+        st.markdown("<h2 style='color: #007BFF;'>Difference Comparison Report</h2>", unsafe_allow_html=True)
 
-                # Differences in other selected columns worksheet
-                if selected_other_columns:
-                    other_diff_df = pd.DataFrame({"Differences in Other Selected Columns": other_diff_report})
-                    other_diff_df.to_excel(writer, sheet_name='Other Diff', index=False)
-
-            # Get binary data
-            excel_bytes = output.getvalue()
-
-            # Download report button
-            st.download_button(
-                label="Download Difference Comparison Report (Excel format)",
-                data=excel_bytes,
-                file_name=f"BOM_Comparison_Report_{timestamp}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        if level_column:
+            # Structural differences; an added or removed subtree is listed by its top row only
+            st.caption(f"Expanded and compared {bom_report['visited_nodes']} node pairs level by level; "
+                       f"all other subtrees are unchanged.")
+            st.markdown("<h3 style='color: #28a745;'>Structural Differences</h3>", unsafe_allow_html=True)
+            st.markdown(f"<h4 style='color: #28a745;'>Nodes present in the old version but not in the new version "
+                        f"({len(bom_report['removed_nodes'])})</h4>", unsafe_allow_html=True)
+            searchable_dataframe(bom_report["removed_nodes"], 'bom_removed_nodes', lang='en')
+            st.markdown(f"<h4 style='color: #28a745;'>Nodes present in the new version but not in the old version "
+                        f"({len(bom_report['added_nodes'])})</h4>", unsafe_allow_html=True)
+            searchable_dataframe(bom_report["added_nodes"], 'bom_added_nodes', lang='en')
+
+            # Position numbers and other selected columns of nodes with the same path
+            st.markdown(f"<h3 style='color: #dc3545;'>Attribute Differences ({len(bom_report['attribute_diffs'])})"
+                        f"</h3>", unsafe_allow_html=True)
+            searchable_dataframe(bom_report["attribute_diffs"], 'bom_attribute_diffs', lang='en')
+        else:
+            # Material usage differences
+            material_diffs = bom_report["material_diffs"]
+            st.markdown(f"<h3 style='color: #28a745;'>Material Usage Differences ({len(material_diffs)} material "
+                        f"codes)</h3>", unsafe_allow_html=True)
+            if material_diffs.empty:
+                st.markdown("<p style='color: #6c757d;'>Material codes are okay.</p>", unsafe_allow_html=True)
+            else:
+                searchable_dataframe(material_diffs, 'bom_material_diffs', lang='en')
+
+            # Extra lines of duplicated materials
+            line_diffs = bom_report["line_diffs"]
+            st.markdown(f"<h3 style='color: #28a745;'>Line Count Differences of Duplicated Materials "
+                        f"({len(line_diffs)} lines)</h3>", unsafe_allow_html=True)
+            if line_diffs.empty:
+                st.markdown("<p style='color: #6c757d;'>Duplicated materials have the same number of lines.</p>",
+                            unsafe_allow_html=True)
+            else:
+                searchable_dataframe(line_diffs, 'bom_line_diffs', lang='en')
+
+            # Position number differences
+            added_count, removed_count = bom_report["position_counts"]
+            st.markdown("<h3 style='color: #ffc107;'>Position Number Differences</h3>", unsafe_allow_html=True)
+            st.markdown(f"<h4 style='color: #ffc107;'>Position numbers present in the new version but not in the old "
+                        f"version ({added_count} positions in {len(bom_report['positions_added'])} materials)</h4>",
+                        unsafe_allow_html=True)
+            searchable_dataframe(bom_report["positions_added"], 'bom_positions_added', lang='en')
+            st.markdown(f"<h4 style='color: #ffc107;'>Position numbers present in the old version but not in the new "
+                        f"version ({removed_count} positions in {len(bom_report['positions_removed'])} materials)</h4>",
+                        unsafe_allow_html=True)
+            searchable_dataframe(bom_report["positions_removed"], 'bom_positions_removed', lang='en')
+
+            # Differences in other selected columns
+            if selected_other_columns:
+                st.markdown(f"<h3 style='color: #dc3545;'>Differences in Other Selected Columns "
+                            f"({len(bom_report['other_diffs'])})</h3>", unsafe_allow_html=True)
+                searchable_dataframe(bom_report["other_diffs"], 'bom_other_diffs', lang='en')
+
+        # Download report button
+        st.download_button(
+            label="Download Difference Comparison Report (Excel format)",
+            data=bom_report["excel_bytes"],
+            file_name=f"BOM_Comparison_Report_{bom_report['timestamp']}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
 else:
     st.info("Please upload the original BOM file and the new BOM file in the sidebar.")
\ No newline at end of file
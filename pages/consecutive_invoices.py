@@ -3,54 +3,67 @@ import pandas as pd
 from io import BytesIO
 import traceback
 
+from excel_loader import file_digest, load_columns, memory_usage, read_excel_preview
+from excel_report import ReportWriter
+from invoice_check import RUN_AMOUNT, RUN_END, RUN_ID, RUN_LENGTH, RUN_SELLERS, RUN_START, run_statistics
+from invoice_index import CONSECUTIVE, DUPLICATE, RELATION, InvoiceIndex
+from table_view import paged_dataframe, paginate, searchable_dataframe
 
-def check_last_two_digits_consecutive(invoice_num):
-    try:
-        # 提取最后两位数字
-        last_two = invoice_num[-2:]
-        prefix = invoice_num[:-2]
-        if last_two.isdigit():
-            num = int(last_two)
-            next_num = prefix + str(num + 1).zfill(2)
-            prev_num = prefix + str(num - 1).zfill(2)
-            return next_num, prev_num
-        return None, None
-    except IndexError:
-        return None, None
-
-
-def check_consecutive_invoices(df, invoice_column):
-    # 把发票号放到一个集合（Python 里集合类似哈希表）里
-    invoice_set = set(df[invoice_column].dropna())
-    consecutive_indices = set()
-
-    # 遍历原始数据的每一行
-    for index, row in df.iterrows():
-        invoice_number = row[invoice_column]
-        if pd.notna(invoice_number):
-            try:
-                next_invoice, prev_invoice = check_last_two_digits_consecutive(invoice_number)
-                if next_invoice and prev_invoice:
-                    # 检查相邻的发票号是否在集合中
-                    if next_invoice in invoice_set or prev_invoice in invoice_set:
-                        consecutive_indices.add(index)
-            except Exception as e:
-                error_message = f"处理发票号 {invoice_number} 时出现错误：{str(e)}"
-                stack_trace = traceback.format_exc()
-                print(error_message)
-                print(stack_trace)
-
-    # 根据索引获取连号发票对应的行数据
-    consecutive_data = df.loc[list(consecutive_indices)]
-    # 按照发票号排序
-    consecutive_data = consecutive_data.sort_values(by=invoice_column)
-    return consecutive_data
+# 连号组统计和跨文件检查使用的金额列和销售方列，文件中没有时不统计
+AMOUNT_COLUMN = "价税合计"
+SELLER_COLUMN = "销售方名称"
 
 
 def make_clickable(url):
     return f'<a href="{url}" target="_blank">发票链接</a>'
 
 
+def detect_runs(uploaded_file, invoice_column, columns):
+    """检查连号发票并统计连号组，文件内容和发票号码列不变时复用上一次的结果
+
+    结果与筛选条件无关，切换筛选列或筛选值时只需在缓存的连号发票上筛选，不重新扫描整个文件。
+    """
+    cache_key = (file_digest(uploaded_file), invoice_column)
+    cached = st.session_state.get('invoice_runs')
+    if cached is None or cached[0] != cache_key:
+        stat_columns = [col for col in (AMOUNT_COLUMN, SELLER_COLUMN) if col in columns and col != invoice_column]
+        df = load_columns(uploaded_file, [invoice_column] + stat_columns)
+        cached = (cache_key, run_statistics(df, invoice_column, AMOUNT_COLUMN, SELLER_COLUMN))
+        st.session_state.invoice_runs = cached
+    return cached[1]
+
+
+def column_values(uploaded_file, column):
+    """返回一列的去重值，文件内容和列不变时复用上一次的结果"""
+    cache_key = (file_digest(uploaded_file), column)
+    cached = st.session_state.get('invoice_column_values')
+    if cached is None or cached[0] != cache_key:
+        values = load_columns(uploaded_file, [column])[column].dropna().unique().tolist()
+        cached = (cache_key, values)
+        st.session_state.invoice_column_values = cached
+    return cached[1]
+
+
+def cross_file_check(uploaded_file, invoice_column, columns):
+    """把文件加入发票索引，返回与其他已索引文件的发票重复或连号的发票
+
+    同一文件只加入一次；结果在文件内容、发票号码列和索引中的文件数不变时复用。
+    """
+    index = InvoiceIndex()
+    digest = file_digest(uploaded_file)
+    if digest not in index:
+        stat_columns = [col for col in (AMOUNT_COLUMN, SELLER_COLUMN) if col in columns and col != invoice_column]
+        df = load_columns(uploaded_file, [invoice_column] + stat_columns)
+        index.add_file(digest, uploaded_file.name, df, invoice_column, AMOUNT_COLUMN, SELLER_COLUMN)
+
+    cache_key = (digest, invoice_column, index.file_count())
+    cached = st.session_state.get('invoice_cross_file')
+    if cached is None or cached[0] != cache_key:
+        cached = (cache_key, index.cross_file_matches(digest))
+        st.session_state.invoice_cross_file = cached
+    return cached[1]
+
+
 def main():
     st.title("发票连号检查")
     st.write("请上传包含发票信息的 Excel 文件。")
@@ -60,10 +73,8 @@ def main():
 
     if uploaded_file is not None:
         try:
-            # 读取 Excel 文件
-            df = pd.read_excel(uploaded_file)
-            # 获取所有列名
-            columns = df.columns.tolist()
+            # 只读取表头获取所有列名，先渲染列选择框
+            columns = read_excel_preview(uploaded_file, nrows=0).columns.tolist()
 
             # 尝试找到“发票类别”列的索引
             default_index = columns.index("发票类别") if "发票类别" in columns else 0
@@ -72,43 +83,77 @@ def main():
             selected_column = st.selectbox("选择列", columns, index=default_index)
 
             # 获取所选列的去重值
-            unique_values = df[selected_column].dropna().unique().tolist()
+            unique_values = column_values(uploaded_file, selected_column)
 
             # 第二个下拉框，选择去重值，默认全部选中
             selected_values = st.multiselect("选择值", unique_values, default=unique_values)
 
-            # 检查连号发票
-            consecutive_data = check_consecutive_invoices(df, "发票号码")
-
-            # 根据所选值筛选数据
-            filtered_data = consecutive_data[consecutive_data[selected_column].isin(selected_values)]
-
-            if not filtered_data.empty:
-                filtered_data["发票原件地址"] = filtered_data["发票原件地址"].apply(make_clickable)
+            # 检查连号发票，并把连号发票划分为连号组，结果按文件缓存
+            consecutive_data, run_summary = detect_runs(uploaded_file, "发票号码", columns)
+            st.caption("加载时压缩列类型，内存占用 {:.1f} MB → {:.1f} MB".format(
+                *(size / 2 ** 20 for size in memory_usage(uploaded_file))))
+
+            # 根据所选值筛选数据：只读取连号发票行的所选列，得到筛选掩码
+            # 连号组汇总只保留筛选后仍有发票的组
+            values = load_columns(uploaded_file, [selected_column], rows=consecutive_data.index)[selected_column]
+            consecutive_data = consecutive_data[values.isin(selected_values).to_numpy()]
+            run_summary = run_summary[run_summary[RUN_ID].isin(consecutive_data[RUN_ID])]
+            run_columns = [RUN_ID, RUN_LENGTH, RUN_START, RUN_END]
+
+            if not consecutive_data.empty:
+                # 连号组汇总，可按连号张数、金额或销售方数从大到小排列
+                st.write(f"共 {len(run_summary)} 个连号组：")
+                sort_options = [col for col in (RUN_LENGTH, RUN_AMOUNT, RUN_SELLERS) if col in run_summary.columns]
+                sort_column = st.radio("连号组排序", sort_options, horizontal=True)
+                run_summary = run_summary.sort_values([sort_column, RUN_ID], ascending=[False, True])
+                paged_dataframe(run_summary, 'invoice_runs', hide_index=True)
 
                 st.write("发现连号的发票对应的行信息：")
 
                 preview_columns = ['发票号码', '销售方名称', '价税合计', '开票日期', '关联单据类型', '单据编号',
                                    '发票原件地址', '发票类别', '创建人']
 
-                # 预览最多 10 行
-                preview = filtered_data[preview_columns]
+                # 预览分页显示，只读取并渲染当前页的行
+                page = paginate(len(consecutive_data), 'invoice_rows')
+                page_rows = consecutive_data.iloc[page]
+                preview = pd.concat([page_rows[[RUN_ID]], load_columns(uploaded_file, preview_columns,
+                                                                       rows=page_rows.index)], axis=1)
+                preview["发票原件地址"] = preview["发票原件地址"].apply(make_clickable)
                 st.write(preview.to_html(escape=False), unsafe_allow_html=True)
 
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    filtered_data.to_excel(writer, index=False)
-                output.seek(0)
+                # 下载文件只在筛选条件变化时重新生成，翻页和排序不重新生成
+                download_key = (file_digest(uploaded_file), selected_column, tuple(selected_values), sort_column)
+                download = st.session_state.get('invoice_download')
+                if download is None or download[0] != download_key:
+                    filtered_data = pd.concat([consecutive_data[run_columns],
+                                               load_columns(uploaded_file, rows=consecutive_data.index)], axis=1)
+                    filtered_data["发票原件地址"] = filtered_data["发票原件地址"].apply(make_clickable)
+                    # 按列批量写出，比 xlsxwriter 逐个单元格写出快得多
+                    output = BytesIO()
+                    writer = ReportWriter(output)
+                    writer.write_frame('连号发票', filtered_data)
+                    writer.write_frame('连号组汇总', run_summary)
+                    writer.close()
+                    download = (download_key, output.getvalue())
+                    st.session_state.invoice_download = download
 
                 # 下载按钮
                 st.download_button(
                     label="下载所有连号发票的数据",
-                    data=output,
+                    data=download[1],
                     file_name="consecutive_invoices.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
             else:
                 st.write("未发现符合条件的连号发票。")
+
+            # 跨文件检查：与之前上传过的文件合并检查重复报销和跨月连号
+            if st.checkbox("加入发票索引，与之前上传的文件一起检查重复报销和连号"):
+                matches = cross_file_check(uploaded_file, "发票号码", columns)
+                duplicates = (matches[RELATION] == DUPLICATE).sum()
+                consecutives = (matches[RELATION] == CONSECUTIVE).sum()
+                st.write(f"与其他文件重复的发票 {duplicates} 处，与其他文件中的发票连号 {consecutives} 处：")
+                searchable_dataframe(matches, 'invoice_cross_file')
         except Exception as e:
             error_message = f"处理文件时出现错误：{str(e)}"
             stack_trace = traceback.format_exc()
@@ -1,12 +1,23 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import locale
 
+from excel_loader import excel_columns, file_digest, load_columns, memory_usage
+from insight_cube import InsightCube
+
 
 # 设置本地化信息，用于添加千分位逗号
 locale.setlocale(locale.LC_ALL, '')
 
+# 表格中数值列的显示格式，由前端显示时格式化，数据保持为数值，点击表头仍按数值排序
+AMOUNT_COLUMN = st.column_config.NumberColumn(format='localized')
+PERCENT_COLUMN = st.column_config.NumberColumn(format='%.2f%%')
+
+# 累计百分比所在区间的行背景色
+CUMULATIVE_BANDS = [(0, 80, 'background-color: #E6E6FA'), (80, 90, 'background-color: #FFFFCC')]
+
 # 设置页面配置，包括标题、图标和布局
 st.set_page_config(page_title='数据洞察图表生成', page_icon='📊', layout='wide')
 
@@ -64,11 +75,18 @@ st.write("这个页面旨在帮助你对 Excel 数据进行深入的洞察分析
 uploaded_file = st.file_uploader("上传 Excel 文件", type=['xlsx', 'xls'])
 
 if uploaded_file is not None:
-    # 读取 Excel 文件
-    df = pd.read_excel(uploaded_file)
-
-    # 获取所有列名
-    columns = df.columns.tolist()
+    # 获取所有列名，数据按需只读取用到的列
+    columns = excel_columns(uploaded_file)
+    st.caption("加载时压缩列类型，内存占用 {:.1f} MB → {:.1f} MB".format(
+        *(size / 2 ** 20 for size in memory_usage(uploaded_file))))
+
+    # 各列的编码和汇总结果按文件缓存，切换选择时只查找已有的汇总结果
+    cached = st.session_state.get('insight_cube')
+    if cached is None or cached[0] != file_digest(uploaded_file):
+        cube = InsightCube(lambda column, file=uploaded_file: load_columns(file, [column])[column])
+        cached = (file_digest(uploaded_file), cube)
+        st.session_state.insight_cube = cached
+    cube = cached[1]
 
     # 创建三列布局，用于放置选择框
     col1, col2, col3 = st.columns(3)
@@ -99,13 +117,16 @@ if uploaded_file is not None:
         "亿": 100000000
     }[selected_unit]
 
-    aggregated_df = df.groupby(selected_dimension)[selected_metric].sum().reset_index()
+    totals = cube.totals(selected_dimension, selected_metric)
+    aggregated_df = totals.reset_index()
 
-    # 绘制柱状图展示指标走势并在柱子上显示数值
+    # 绘制柱状图展示指标走势并在柱子上显示数值，数值标签取整后由图表按千分位格式显示
+    scaled = aggregated_df[selected_metric] / unit_multiplier
     fig_bar = go.Figure(data=[go.Bar(
         x=aggregated_df[selected_dimension],
-        y=aggregated_df[selected_metric] / unit_multiplier,
-        text=[locale.format_string('%d', val / unit_multiplier, grouping=True) for val in aggregated_df[selected_metric]],
+        y=scaled,
+        text=np.trunc(scaled),
+        texttemplate='%{text:,.0f}',
         textposition='auto',
         marker_color='skyblue'
     )])
@@ -122,21 +143,18 @@ if uploaded_file is not None:
     st.plotly_chart(fig_bar, use_container_width=True)
 
     # 选择分析维度值范围
-    dimension_values = df[selected_dimension].unique().tolist()
+    dimension_values = cube.values(selected_dimension)
     selected_values = st.multiselect(f"选择 {selected_dimension} 的值进行细化分析", dimension_values)
 
     if len(selected_values) != 2:
         st.error(f"请准确选择两个 {selected_dimension} 的值进行细化分析。")
     else:
-        # 筛选数据
-        filtered_df = df[df[selected_dimension].isin(selected_values)]
-
         # 选择引发变动的维度
         remaining_columns = [col for col in columns if col not in [selected_dimension, selected_metric]]
         causal_dimension = st.selectbox("选择引发变动的维度", remaining_columns)
 
-        # 按引发变动的维度和选择的对比维度分组计算指标总和
-        grouped = filtered_df.groupby([causal_dimension, selected_dimension])[selected_metric].sum().unstack()
+        # 按引发变动的维度和选择的对比维度分组计算指标总和，从预聚合结果中取出两个选择的值
+        grouped = cube.cross(causal_dimension, selected_dimension, selected_metric, selected_values)
 
         # 计算变化量
         grouped['变化量'] = grouped[selected_values[-1]] - grouped[selected_values[0]]
@@ -150,10 +168,8 @@ if uploaded_file is not None:
         total_decrease = decreased['变化量'].sum() / unit_multiplier
         net_change = total_increase + total_decrease
 
-        initial_value = filtered_df[filtered_df[selected_dimension] == selected_values[0]][
-                            selected_metric].sum() / unit_multiplier
-        final_value = filtered_df[filtered_df[selected_dimension] == selected_values[-1]][
-                          selected_metric].sum() / unit_multiplier
+        initial_value = totals.get(selected_values[0], 0) / unit_multiplier
+        final_value = totals.get(selected_values[-1], 0) / unit_multiplier
 
         if initial_value != 0:
             net_change_percentage = net_change / initial_value * 100
@@ -165,31 +181,16 @@ if uploaded_file is not None:
         num_decreased = len(decreased)
         total_num = num_increased + num_decreased
 
-        # 增加量表格优化
-        if not increased.empty:
-            increased['变化量（格式化）'] = increased['变化量'].apply(
-                lambda x: locale.format_string('%d', x / unit_multiplier, grouping=True))
-            increased['占增加总额百分比'] = (increased['变化量'] / (increased['变化量'].sum()) * 100).map(
-                '{:.2f}%'.format)
-            increased['累计增加额百分比'] = (increased['变化量'].cumsum() / (increased['变化量'].sum()) * 100).map(
-                '{:.2f}%'.format)
-            increased['增加前的量'] = (increased[selected_values[0]] / unit_multiplier).apply(
-                lambda x: locale.format_string('%d', x, grouping=True))
-            increased['增加后的量'] = (increased[selected_values[-1]] / unit_multiplier).apply(
-                lambda x: locale.format_string('%d', x, grouping=True))
-
-        # 减少量表格优化
-        if not decreased.empty:
-            decreased['变化量（格式化）'] = decreased['变化量'].apply(
-                lambda x: locale.format_string('%d', x / unit_multiplier, grouping=True))
-            decreased['占减少总额百分比'] = (decreased['变化量'] / (decreased['变化量'].sum()) * 100).map(
-                '{:.2f}%'.format)
-            decreased['累计减少额百分比'] = (decreased['变化量'].cumsum() / (decreased['变化量'].sum()) * 100).map(
-                '{:.2f}%'.format)
-            decreased['减少前的量'] = (decreased[selected_values[0]] / unit_multiplier).apply(
-                lambda x: locale.format_string('%d', x, grouping=True))
-            decreased['减少后的量'] = (decreased[selected_values[-1]] / unit_multiplier).apply(
-                lambda x: locale.format_string('%d', x, grouping=True))
+        # 增加量和减少量表格的各列按整列计算，金额按单位换算后取整，百分比保留原值，显示格式由表格列配置决定
+        def change_table(changes, verb):
+            total = changes['变化量'].sum()
+            return pd.DataFrame({
+                f'{verb}前的量': np.trunc(changes[selected_values[0]] / unit_multiplier),
+                f'{verb}后的量': np.trunc(changes[selected_values[-1]] / unit_multiplier),
+                f'{verb}量': np.trunc(changes['变化量'] / unit_multiplier),
+                f'占{verb}总额百分比': changes['变化量'] / total * 100,
+                f'累计{verb}百分比': changes['变化量'].cumsum() / total * 100,
+            })
 
         # 显示增加的数据表格描述
         st.subheader(f'{causal_dimension} 维度下 {selected_metric} 数据变化情况（单位：{selected_unit}）')
@@ -199,37 +200,33 @@ if uploaded_file is not None:
         st.write(description)
 
 
-        def color_cumulative_percentage(row):
-            try:
-                value = float(row['累计增加百分比' if '累计增加百分比' in row.index else '累计减少百分比'].rstrip('%'))
-                if 0 <= value <= 80:
-                    return ['background-color: #E6E6FA'] * len(row)
-                elif 80 < value <= 90:
-                    return ['background-color: #FFFFCC'] * len(row)
-                else:
-                    return [''] * len(row)
-            except ValueError:
-                return [''] * len(row)
+        def color_cumulative_percentage(table):
+            # 按累计百分比所在的区间一次算出整张表的背景色
+            value = table.iloc[:, -1].to_numpy(dtype=float)
+            conditions = [(value >= low if i == 0 else value > low) & (value <= high)
+                          for i, (low, high, _) in enumerate(CUMULATIVE_BANDS)]
+            styles = np.select(conditions, [style for _, _, style in CUMULATIVE_BANDS], '')
+            return pd.DataFrame(np.repeat(styles[:, None], table.shape[1], axis=1), index=table.index,
+                                columns=table.columns)
+
+
+        def show_change_table(changes, verb):
+            table = change_table(changes, verb)
+            column_config = {col: PERCENT_COLUMN if '百分比' in col else AMOUNT_COLUMN for col in table.columns}
+            st.dataframe(table.style.apply(color_cumulative_percentage, axis=None), column_config=column_config,
+                         use_container_width=True)
 
 
         # 显示增加的数据表格
         st.subheader(f'{causal_dimension} 维度下 {selected_metric} 增加的数据（从大到小排序）')
         if not increased.empty:
-            increased_display = increased[
-                ['增加前的量', '增加后的量', '变化量（格式化）', '占增加总额百分比', '累计增加额百分比']]
-            increased_display.columns = ['增加前的量', '增加后的量', '增加量', '占增加总额百分比', '累计增加百分比']
-            styled_increased = increased_display.style.apply(color_cumulative_percentage, axis=1)
-            st.dataframe(styled_increased, use_container_width=True)
+            show_change_table(increased, '增加')
         else:
             st.write('无增加的数据')
 
         # 显示减少的数据表格
         st.subheader(f'{causal_dimension} 维度下 {selected_metric} 减少的数据（从多到少排序）')
         if not decreased.empty:
-            decreased_display = decreased[
-                ['减少前的量', '减少后的量', '变化量（格式化）', '占减少总额百分比', '累计减少额百分比']]
-            decreased_display.columns = ['减少前的量', '减少后的量', '减少量', '占减少总额百分比', '累计减少百分比']
-            styled_decreased = decreased_display.style.apply(color_cumulative_percentage, axis=1)
-            st.dataframe(styled_decreased, use_container_width=True)
+            show_change_table(decreased, '减少')
         else:
             st.write('无减少的数据')
\ No newline at end of file
@@ -4,6 +4,8 @@ import io
 from openai import OpenAI
 import re
 
+from excel_loader import load_excel
+
 
 # 调用 Kimi 大模型生成代码
 def call_kimi(table_structures, user_prompt, app_key):
@@ -84,7 +86,7 @@ def main():
         dataframes = []
         for i, file in enumerate(uploaded_files):
             try:
-                df = pd.read_excel(file)
+                df = load_excel(file)
                 dataframes.append(df)
                 # 获取列名和数据类型
                 columns = df.columns.tolist()
@@ -122,7 +124,7 @@ def main():
                     # 执行生成的代码
                     local_vars = {'pd': pd}
                     for i, df in enumerate(dataframes):
-                        local_vars[f'df{i}'] = df
+                        local_vars[f'df{i}'] = df.copy()
                     exec(clean_code, globals(), local_vars)
                     result = local_vars.get('result')
 
@@ -1,98 +1,35 @@
 import streamlit as st
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
+import numpy as np
 import io
-import re
-
-
-def remove_html_tags(text):
-    """去除 HTML 标签的函数"""
-    clean = re.compile('<.*?>')
-    return re.sub(clean, '', text)
-
-
-def compare_excels(file1, file2, primary_keys, selected_columns):
-    df1 = pd.read_excel(file1)
-    df2 = pd.read_excel(file2)
-
-    # 只保留共有的列且排除主键
-    common_columns = [col for col in selected_columns if
-                      col in df1.columns and col in df2.columns and col not in primary_keys]
-
-    # 只列出两个 Excel 主键可关联到的行
-    merged_df = pd.merge(df1, df2, on=primary_keys, how='inner', suffixes=('_A', '_B'))
-
-    # 对比结果
-    comparison_result = []
-    for _, row in merged_df.iterrows():
-        is_match = True
-        for col in common_columns:
-            col_a = f'{col}_A'
-            col_b = f'{col}_B'
-            if row[col_a] != row[col_b]:
-                is_match = False
-                break
-        comparison_result.append('Y' if is_match else 'N')
-
-    merged_df['比对结果'] = comparison_result
-
-    # 标记不一致的列
-    for col in common_columns:
-        col_a = f'{col}_A'
-        col_b = f'{col}_B'
-        merged_df[f'{col}_A'] = [
-            f'<span style="color:red">{val}</span>' if merged_df['比对结果'][i] == 'N' and val != merged_df[col_b][
-                i] else val for i, val in
-            enumerate(merged_df[col_a])]
-        merged_df[f'{col}_B'] = [
-            f'<span style="color:red">{val}</span>' if merged_df['比对结果'][i] == 'N' and val != merged_df[col_a][
-                i] else val for i, val in
-            enumerate(merged_df[col_b])]
-
-    # 第一个表格有第二个表格没有的数据
-    df1_only = df1[~df1[primary_keys].apply(tuple, axis=1).isin(df2[primary_keys].apply(tuple, axis=1))]
-    # 第二个表格有第一个表格没有的数据
-    df2_only = df2[~df2[primary_keys].apply(tuple, axis=1).isin(df1[primary_keys].apply(tuple, axis=1))]
-
-    return merged_df, df1_only, df2_only
-
-
-def highlight_excel(workbook, df, primary_keys, common_columns):
-    sheet = workbook.active
-    header = next(dataframe_to_rows(df, index=False, header=True))
-    sheet.append(header)
-    for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=False), start=2):
-        for c_idx, value in enumerate(row, start=1):
-            col_name = df.columns[c_idx - 1]
-            base_col = col_name.replace("_A", "").replace("_B", "")
-            if base_col in common_columns:
-                col_a = f'{base_col}_A'
-                col_b = f'{base_col}_B'
-                if df['比对结果'].iloc[r_idx - 2] == 'N' and df[col_a].iloc[r_idx - 2] != df[col_b].iloc[r_idx - 2]:
-                    sheet.cell(row=r_idx, column=c_idx).fill = PatternFill(start_color='FF0000', end_color='FF0000',
-                                                                           fill_type='solid')
-            # 去除 HTML 标签
-            clean_value = remove_html_tags(str(value))
-            sheet.cell(row=r_idx, column=c_idx).value = clean_value
-    return workbook
-
-
-def write_df_to_excel(workbook, df, sheet_name):
-    sheet = workbook.create_sheet(sheet_name)
-    for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), start=1):
-        for c_idx, value in enumerate(row, start=1):
-            sheet.cell(row=r_idx, column=c_idx).value = value
-    return workbook
-
-
-def check_primary_key_uniqueness(df, primary_keys):
-    """检查主键的唯一性"""
-    grouped = df.groupby(primary_keys).size()
-    if any(grouped > 1):
-        return False
-    return True
+import os
+
+from excel_diff import SUFFIXES, AlignedCompare
+from excel_loader import file_digest, load_excel, read_excel_preview, spill_dir
+from excel_partition import PREVIEW_MISMATCH_ROWS, compare_partitioned
+from excel_report import write_compare_report
+from table_view import paged_dataframe
+
+
+def aligned_compare(file1, file2, primary_keys):
+    """按主键对齐两个表格，文件内容和主键不变时复用上一次的对齐结果"""
+    cache_key = (file_digest(file1), file_digest(file2), tuple(primary_keys))
+    cached = st.session_state.get('aligned_compare')
+    if cached is None or cached[0] != cache_key:
+        cached = (cache_key, AlignedCompare(load_excel(file1), load_excel(file2), primary_keys))
+        st.session_state.aligned_compare = cached
+    return cached[1]
+
+
+def mismatch_highlight(mismatch):
+    """把按对比列计算的不一致矩阵展开到结果表中对应的 _A 和 _B 两列"""
+    return pd.DataFrame({f'{col}{suffix}': mismatch[col] for col in mismatch.columns for suffix in SUFFIXES},
+                        index=mismatch.index)
+
+
+def check_primary_key_uniqueness(key_index):
+    """检查主键在两个表格中的唯一性"""
+    return key_index.unique1 and key_index.unique2
 
 
 def excel_compare():
@@ -105,12 +42,21 @@ def excel_compare():
         file1 = st.file_uploader("上传第一个 Excel 文件", type=["xlsx", "xls"])
         file2 = st.file_uploader("上传第二个 Excel 文件", type=["xlsx", "xls"])
 
+        # 大文件模式按块流式读取、按主键分区对比，不把整个文件读入内存
+        large_file_mode = st.toggle("大文件模式", help="文件大到无法整体读入内存时使用，按主键分区逐块对比，"
+                                                       "页面只显示部分不一致的数据，完整结果请下载报告查看。")
+
         if file1 and file2:
-            df1 = pd.read_excel(file1)
-            df2 = pd.read_excel(file2)
+            if large_file_mode:
+                columns1 = read_excel_preview(file1, nrows=0).columns
+                columns2 = read_excel_preview(file2, nrows=0).columns
+            else:
+                df1 = load_excel(file1)
+                df2 = load_excel(file2)
+                columns1, columns2 = df1.columns, df2.columns
 
             # 获取所有列名
-            all_columns = list(set(df1.columns).intersection(set(df2.columns)))
+            all_columns = list(set(columns1).intersection(set(columns2)))
 
             st.subheader("参数设置")
             st.write("请选择用于对比的主键和参与对比的列。")
@@ -123,60 +69,148 @@ def excel_compare():
 
             compare_button = st.button("开始对比", use_container_width=True)
 
+            # 文件或参数变化后，之前的对比结果不再显示
+            compare_inputs = (file1.file_id, file2.file_id, tuple(primary_keys), tuple(selected_columns),
+                              large_file_mode)
+
     if 'compare_button' in locals() and compare_button:
         if not primary_keys:
             st.error("请至少选择一个主键。")
+        elif large_file_mode:
+            # 报告直接写入磁盘，主键唯一性在逐个分区对比时检查
+            report_path = os.path.join(spill_dir(), '对比结果.xlsx')
+            progress_bar = st.progress(0.0)
+            try:
+                with open(report_path, 'wb') as output:
+                    summary = compare_partitioned(file1, file2, primary_keys, selected_columns, output,
+                                                  progress=progress_bar.progress)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.session_state.compare_result = {
+                    'inputs': compare_inputs,
+                    'summary': summary,
+                    'report_path': report_path,
+                }
+            finally:
+                progress_bar.empty()
         else:
+            # 主键编码索引和关联结果按文件和主键缓存，唯一性检查和对比共用
+            aligned = aligned_compare(file1, file2, primary_keys)
+
             # 检查主键的唯一性
-            if not check_primary_key_uniqueness(df1, primary_keys) or not check_primary_key_uniqueness(df2,
-                                                                                                       primary_keys):
+            if not check_primary_key_uniqueness(aligned.key_index):
                 st.error("选择的主键在表格中不唯一，请重新选择主键。")
             else:
-                result_df, df1_only, df2_only = compare_excels(file1, file2, primary_keys, selected_columns)
-
-                # 显示对比概要信息
-                total_rows = len(result_df)
-                inconsistent_rows = len(result_df[result_df['比对结果'] == 'N'])
-                st.write(f"共 {total_rows} 行，不一致的 {inconsistent_rows} 行。")
-
-                # 显示对比结果
-                st.write("共同数据对比结果：")
-                st.write(result_df.to_html(escape=False), unsafe_allow_html=True)
-
-                st.markdown("---")
-
-                # 显示第一个表格有第二个表格没有的数据
-                st.write("第一个表格有第二个表格没有的数据：")
-                st.dataframe(df1_only)
-
-                st.markdown("---")
-
-                # 显示第二个表格有第一个表格没有的数据
-                st.write("第二个表格有第一个表格没有的数据：")
-                st.dataframe(df2_only)
-
-                st.markdown("---")
-
-                # 创建带有颜色标记的 Excel 文件
-                wb = Workbook()
-                wb = highlight_excel(wb, result_df, primary_keys,
-                                     [col for col in selected_columns if col not in primary_keys])
-                wb = write_df_to_excel(wb, df1_only, '第一个表格独有的数据')
-                wb = write_df_to_excel(wb, df2_only, '第二个表格独有的数据')
-
-                # 保存 Excel 文件到内存
-                output = io.BytesIO()
-                wb.save(output)
-                output.seek(0)
-
-                # 下载对比结果
-                st.download_button(
-                    label="下载对比结果",
-                    data=output,
-                    file_name="对比结果.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+                # 只计算新增对比列的差异，主键关联和独有行复用已有结果
+                result_df, df1_only, df2_only, mismatch = aligned.compare(selected_columns)
+
+                # 翻页等操作会重新运行页面，对比结果保存在 session_state 中，报告在需要时才生成
+                st.session_state.compare_result = {
+                    'inputs': compare_inputs,
+                    'result_df': result_df,
+                    'df1_only': df1_only,
+                    'df2_only': df2_only,
+                    'mismatch': mismatch,
+                    'report': None,
+                }
+
+    compare_result = st.session_state.get('compare_result')
+    if compare_result is None or 'compare_inputs' not in locals() or compare_result['inputs'] != compare_inputs:
+        return
+    if 'summary' in compare_result:
+        show_partitioned_result(compare_result['summary'], compare_result['report_path'])
+    else:
+        show_compare_result(compare_result)
+
+
+def show_compare_result(compare_result):
+    result_df = compare_result['result_df']
+    df1_only = compare_result['df1_only']
+    df2_only = compare_result['df2_only']
+    mismatch = compare_result['mismatch']
+
+    # 显示对比概要信息
+    mismatch_rows = np.flatnonzero(result_df['比对结果'].to_numpy() == 'N')
+    st.write(f"共 {len(result_df)} 行，不一致的 {len(mismatch_rows)} 行。")
+
+    # 显示各列不一致的行数
+    mismatch_counts = mismatch.sum()
+    st.write("各列不一致行数：")
+    st.dataframe(pd.DataFrame({'列名': mismatch_counts.index, '不一致行数': mismatch_counts.to_numpy()}),
+                 hide_index=True)
+
+    # 显示对比结果，默认只显示不一致的行，每次只渲染一页
+    st.write("共同数据对比结果：")
+    only_mismatch = st.toggle("只显示不一致的行", value=True)
+    paged_dataframe(result_df, 'compare_result', rows=mismatch_rows if only_mismatch else None,
+                    highlight=mismatch_highlight(mismatch))
+
+    st.markdown("---")
+
+    # 显示第一个表格有第二个表格没有的数据
+    st.write("第一个表格有第二个表格没有的数据：")
+    paged_dataframe(df1_only, 'compare_df1_only')
+
+    st.markdown("---")
+
+    # 显示第二个表格有第一个表格没有的数据
+    st.write("第二个表格有第一个表格没有的数据：")
+    paged_dataframe(df2_only, 'compare_df2_only')
+
+    st.markdown("---")
+
+    # 生成报告比对比本身耗时，点击后才生成，并保留到下次对比
+    if compare_result['report'] is None and st.button("生成 Excel 报告", use_container_width=True):
+        with st.spinner("正在生成报告..."):
+            # 创建带有颜色标记的 Excel 文件，直接写入内存
+            output = io.BytesIO()
+            write_compare_report(output, result_df, mismatch, df1_only, df2_only)
+            compare_result['report'] = output.getvalue()
+
+    # 下载对比结果
+    if compare_result['report'] is not None:
+        st.download_button(
+            label="下载对比结果",
+            data=compare_result['report'],
+            file_name="对比结果.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True
+        )
+
+
+def show_partitioned_result(summary, report_path):
+    # 显示对比概要信息
+    st.write(f"共 {summary['total_rows']} 行，不一致的 {summary['mismatch_rows']} 行。")
+
+    # 显示各列不一致的行数
+    mismatch_counts = summary['mismatch_counts']
+    st.write("各列不一致行数：")
+    st.dataframe(pd.DataFrame({'列名': mismatch_counts.index, '不一致行数': mismatch_counts.to_numpy()}),
+                 hide_index=True)
+
+    # 只预览部分不一致的行
+    if summary['preview'] is not None:
+        st.write(f"不一致数据预览（最多 {PREVIEW_MISMATCH_ROWS} 行）：")
+        paged_dataframe(summary['preview'], 'compare_preview',
+                        highlight=mismatch_highlight(summary['preview_mismatch']))
+
+    st.markdown("---")
+
+    st.write(f"第一个表格有第二个表格没有的数据：{summary['df1_only_rows']} 行")
+    st.write(f"第二个表格有第一个表格没有的数据：{summary['df2_only_rows']} 行")
+
+    st.markdown("---")
+
+    # 下载对比结果
+    with open(report_path, 'rb') as report:
+        st.download_button(
+            label="下载对比结果",
+            data=report,
+            file_name="对比结果.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            use_container_width=True
+        )
 
 
 if __name__ == '__main__':
@@ -6,6 +6,8 @@ import queue
 import threading
 from time import time
 
+from excel_loader import load_excel, read_excel_preview
+
 # 设置页面布局
 st.set_page_config(layout="wide")
 
@@ -38,12 +40,12 @@ if 'app_key' not in st.session_state:
 
 if uploaded_file:
     try:
-        # 读取 Excel 文件
-        df = pd.read_excel(uploaded_file)
+        # 只读取前 10 行用于预览，完整数据在点击确定后再读取
+        preview = read_excel_preview(uploaded_file, nrows=10)
 
         # 预览前 10 行数据
         st.subheader("文件数据预览")
-        st.dataframe(df.head(10), use_container_width=True)
+        st.dataframe(preview, use_container_width=True)
 
         # 添加一些分隔线和空格，增强视觉效果
         st.markdown("<hr>", unsafe_allow_html=True)
@@ -129,7 +131,7 @@ if uploaded_file:
                             request_queue.task_done()
 
                     # 预览部分（前 1 行）
-                    preview_df = df.head(1).copy()
+                    preview_df = preview.head(1).copy()
                     if version == "免费版":
                         request_queue = queue.Queue()
                         processing_thread = threading.Thread(target=process_requests, args=(request_queue, preview_df, st.session_state.prompts, st.session_state.new_column_names))
@@ -153,7 +155,7 @@ if uploaded_file:
                     st.write("")
 
                     # 下载按钮
-                    st.session_state.full_df = df.copy()
+                    st.session_state.full_df = load_excel(uploaded_file).copy()
                     if version == "免费版":
                         request_queue = queue.Queue()
                         processing_thread = threading.Thread(target=process_requests, args=(request_queue, st.session_state.full_df, st.session_state.prompts, st.session_state.new_column_names))
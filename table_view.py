@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# 可选的每页行数
+PAGE_SIZES = (20, 50, 100, 200, 500)
+
+# 标记单元格的样式
+HIGHLIGHT_STYLE = 'color: red'
+
+# 分页和搜索控件的文字
+LABELS = {
+    'zh': {
+        'page_size': "每页行数",
+        'page': "页码",
+        'range': "第 {start}-{stop} 行，共 {total} 行，{pages} 页",
+        'search': "搜索",
+        'search_placeholder': "输入关键字筛选",
+    },
+    'en': {
+        'page_size': "Rows per page",
+        'page': "Page",
+        'range': "Rows {start}-{stop} of {total}, {pages} pages",
+        'search': "Search",
+        'search_placeholder': "Type to filter",
+    },
+}
+
+
+def paginate(total_rows, key, page_size=50, lang='zh'):
+    """显示分页控件，返回当前页的行位置范围
+
+    页面只按范围取出当前页的数据渲染，渲染耗时和传给浏览器的数据量只与每页行数有关。
+    """
+    labels = LABELS[lang]
+    size_col, page_col, info_col = st.columns([1, 1, 2])
+    page_size = size_col.selectbox(labels['page_size'], PAGE_SIZES, index=PAGE_SIZES.index(page_size),
+                                   key=f'{key}_page_size')
+    pages = max(1, math.ceil(total_rows / page_size))
+
+    # 数据或每页行数变化后，之前的页码可能超出范围
+    page_key = f'{key}_page'
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = page_col.number_input(labels['page'], min_value=1, max_value=pages, step=1, key=page_key)
+
+    start = (page - 1) * page_size
+    stop = min(start + page_size, total_rows)
+    info_col.caption(labels['range'].format(start=start + 1 if total_rows else 0, stop=stop, total=total_rows,
+                                            pages=pages))
+    return slice(start, stop)
+
+
+def show_page(df, rows, highlight=None, hide_index=None):
+    """显示表格中 rows 指定位置的行
+
+    highlight 为与 df 按位置对齐的布尔表，列为 df 中的部分列，为 True 的单元格标红。
+    """
+    page_df = df.iloc[rows]
+    if highlight is not None:
+        marks = highlight.iloc[rows]
+        styles = pd.DataFrame(np.where(marks, HIGHLIGHT_STYLE, ''), index=page_df.index, columns=marks.columns)
+        page_df = page_df.style.apply(lambda _: styles, axis=None, subset=list(styles.columns))
+    st.dataframe(page_df, hide_index=hide_index)
+
+
+def paged_dataframe(df, key, rows=None, highlight=None, page_size=50, lang='zh', hide_index=None):
+    """分页显示表格，rows 为只显示的行位置，默认显示全部行"""
+    total_rows = len(df) if rows is None else len(rows)
+    page = paginate(total_rows, key, page_size, lang)
+    show_page(df, page if rows is None else rows[page], highlight, hide_index)
+
+
+def search_rows(df, query):
+    """返回任一列包含 query 的行位置，不区分大小写"""
+    matched = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        matched |= df[col].astype(str).str.contains(query, case=False, regex=False, na=False).to_numpy(dtype=bool)
+    return np.flatnonzero(matched)
+
+
+def searchable_dataframe(df, key, page_size=50, lang='zh'):
+    """带搜索框的分页表格，只显示任一列包含关键字的行"""
+    labels = LABELS[lang]
+    query = st.text_input(labels['search'], key=f'{key}_search', placeholder=labels['search_placeholder'])
+    rows = search_rows(df, query) if query else None
+    paged_dataframe(df, key, rows=rows, page_size=page_size, lang=lang, hide_index=True)
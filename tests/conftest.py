@@ -0,0 +1,35 @@
+import io
+import os
+import sys
+
+import openpyxl
+import pytest
+
+# 被测模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Upload:
+    """模拟 Streamlit 的上传文件，内容为由各行生成的 xlsx"""
+
+    def __init__(self, name, rows, number_formats=None):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        for row in rows:
+            sheet.append(row)
+        # number_formats 为 {列号: 格式}，应用于表头以下的各行
+        for col, number_format in (number_formats or {}).items():
+            for cells in sheet.iter_rows(min_row=2, min_col=col + 1, max_col=col + 1):
+                cells[0].number_format = number_format
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        self.name = name
+        self._data = buffer.getvalue()
+
+    def getvalue(self):
+        return self._data
+
+
+@pytest.fixture
+def make_upload():
+    return Upload
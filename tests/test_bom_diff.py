@@ -0,0 +1,14 @@
+import pandas as pd
+
+from bom_diff import LINE, compare_boms
+
+
+def test_extra_lines_of_duplicated_materials_are_reported():
+    original = pd.DataFrame({'物料编码': ['A', 'A', 'B'], '位置号': ['R1', 'R2', 'R3'], '数量': [1, 2, 3]})
+    new = pd.DataFrame({'物料编码': ['A', 'A', 'A', 'B'], '位置号': ['R1', 'R2', 'R5', 'R3'], '数量': [1, 2, 9, 3]})
+
+    result = compare_boms(original, new, '物料编码', '位置号', ['数量'])
+
+    assert result['removed_lines'].empty
+    assert result['added_lines'].to_dict('records') == [{'物料编码': 'A', LINE: 3, '位置号': 'R5', '数量': 9}]
+    assert result['other_diffs'].empty
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from excel_diff import KeyIndex, compare_frames
+
+
+def test_repeated_null_keys_do_not_count_as_duplicates():
+    df1 = pd.DataFrame({'编号': [1, np.nan, np.nan], '金额': [10, 20, 30]})
+    df2 = pd.DataFrame({'编号': [1, np.nan], '金额': [10, 25]})
+
+    key_index = KeyIndex(df1, df2, ['编号'])
+    assert key_index.unique1 and key_index.unique2
+
+    merged, df1_only, df2_only, mismatch = compare_frames(df1, df2, ['编号'], ['金额'], key_index)
+    # 与 pd.merge 一致，两边为空的键互相关联
+    expected = pd.merge(df1, df2, on=['编号'], suffixes=('_A', '_B'))
+    assert merged[['编号', '金额_A', '金额_B']].equals(expected)
+    assert mismatch['金额'].tolist() == [False, True, True]
+    assert df1_only.empty and df2_only.empty
+
+
+def test_repeated_non_null_keys_are_duplicates():
+    df1 = pd.DataFrame({'编号': [1, 1], '金额': [10, 20]})
+    df2 = pd.DataFrame({'编号': [1], '金额': [10]})
+
+    key_index = KeyIndex(df1, df2, ['编号'])
+    assert not key_index.unique1 and key_index.unique2
@@ -0,0 +1,18 @@
+import pandas as pd
+
+from excel_handler import SAMPLE_SIZE, get_column_type
+
+
+def test_mixed_utc_offsets_in_sample_are_text():
+    values = pd.Series(['2024-01-01 10:00+08:00', '2024-01-02 10:00+00:00'])
+    assert get_column_type(values) == '文本类型'
+
+
+def test_mixed_utc_offsets_after_sample_are_text():
+    values = pd.Series(['2024-01-01 10:00+08:00'] * SAMPLE_SIZE + ['2024-01-02 10:00+00:00'])
+    assert get_column_type(values) == '文本类型'
+
+
+def test_dates_with_one_offset_are_datetimes():
+    values = pd.Series(['2024-01-01 10:00+08:00', '2024-01-02 11:30+08:00'])
+    assert get_column_type(values) == '时间日期类型'
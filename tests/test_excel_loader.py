@@ -0,0 +1,24 @@
+import io
+
+import pandas as pd
+
+from excel_loader import iter_excel_chunks, read_excel, read_excel_preview
+
+
+def test_duration_formats_are_read_as_timedeltas(make_upload):
+    upload = make_upload('durations.xlsx', [['时长', '日期'], [5 / 24, 45000.25], [1.25, 45001.5]],
+                         number_formats={0: '[h]:mm:ss', 1: 'yyyy-mm-dd hh:mm'})
+
+    expected = read_excel(io.BytesIO(upload.getvalue()))
+    assert expected['时长'].tolist() == [pd.Timedelta(hours=5), pd.Timedelta(hours=30)]
+    pd.testing.assert_frame_equal(read_excel_preview(upload), expected)
+    pd.testing.assert_frame_equal(next(iter_excel_chunks(upload)), expected)
+
+
+def test_chunks_match_read_excel_when_header_is_preceded_by_blank_rows(make_upload):
+    upload = make_upload('blank.xlsx', [[], [], [None, '编号', '金额'], [None, 1, 10], [], [None, 2, 20]])
+
+    expected = read_excel(io.BytesIO(upload.getvalue()))
+    assert len(expected.columns) == 3
+    pd.testing.assert_frame_equal(read_excel_preview(upload), expected)
+    pd.testing.assert_frame_equal(pd.concat(iter_excel_chunks(upload, chunk_rows=2), ignore_index=True), expected)
@@ -0,0 +1,18 @@
+import io
+
+from excel_diff import compare_frames
+from excel_loader import read_excel
+from excel_partition import compare_partitioned
+
+
+def test_partitioned_matches_normal_mode_for_numbers_stored_as_text(make_upload):
+    file1 = make_upload('a.xlsx', [['编号', '金额'], ['001', '100'], ['002', '250.5']])
+    file2 = make_upload('b.xlsx', [['编号', '金额'], [1, 100], [2, 250.5]])
+
+    merged, df1_only, df2_only, mismatch = compare_frames(
+        read_excel(io.BytesIO(file1.getvalue())), read_excel(io.BytesIO(file2.getvalue())), ['编号'], ['金额'])
+    summary = compare_partitioned(file1, file2, ['编号'], ['金额'], io.BytesIO(), n_partitions=4)
+
+    assert (len(merged), int(mismatch.any(axis=1).sum()), len(df1_only), len(df2_only)) == (2, 0, 0, 0)
+    assert (summary['total_rows'], summary['mismatch_rows'], summary['df1_only_rows'],
+            summary['df2_only_rows']) == (2, 0, 0, 0)
@@ -0,0 +1,27 @@
+import io
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from excel_report import ReportWriter
+
+
+def test_integers_beyond_double_precision_are_written_as_text():
+    df = pd.DataFrame({
+        '单据号': np.array([1, 2 ** 53, 2 ** 53 + 1, -2 ** 60], dtype=np.int64),
+        '发票号': np.array([1, 2 ** 64 - 1, 5, 2 ** 53 + 1], dtype=np.uint64),
+        '编号': pd.array([1, None, 12345678901234567, 3], dtype='Int64'),
+    })
+    buffer = io.BytesIO()
+    writer = ReportWriter(buffer)
+    writer.write_frame('结果', df)
+    writer.close()
+
+    rows = list(openpyxl.load_workbook(buffer).active.values)
+    assert rows[1:] == [
+        (1, 1, 1),
+        (9007199254740992, '18446744073709551615', None),
+        ('9007199254740993', 5, '12345678901234567'),
+        ('-1152921504606846976', '9007199254740993', 3),
+    ]
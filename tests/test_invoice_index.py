@@ -0,0 +1,17 @@
+import pandas as pd
+
+from invoice_index import AMOUNT, OTHER_AMOUNT, OTHER_SELLER, RELATION, SELLER, InvoiceIndex
+
+
+def test_cross_file_matches_show_amounts_and_sellers(tmp_path):
+    index = InvoiceIndex(str(tmp_path / 'index.sqlite3'))
+    df1 = pd.DataFrame({'发票号码': ['04400100', '04400105'], '价税合计': [100.0, 50.0], '销售方名称': ['甲', '乙']})
+    df2 = pd.DataFrame({'发票号码': ['04400100', '04400106']})
+    assert index.add_file('a', 'a.xlsx', df1, '发票号码', '价税合计', '销售方名称')
+    assert index.add_file('b', 'b.xlsx', df2, '发票号码', '价税合计', '销售方名称')
+
+    matches = index.cross_file_matches('b')
+    assert matches[RELATION].tolist() == ['重复', '连号']
+    assert matches[[AMOUNT, SELLER]].isna().all().all()
+    assert matches[OTHER_AMOUNT].tolist() == [100.0, 50.0]
+    assert matches[OTHER_SELLER].tolist() == ['甲', '乙']